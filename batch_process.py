@@ -0,0 +1,275 @@
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+matplotlib.use('Agg')  # Never open a window from the workers
+import numpy as np
+from shapely.geometry import LineString
+
+from segment_array import SegmentArray, concatenate
+from sampling import flatten_segments, flatten_path
+from regularize import regularize_segments, save_segments_to_svg
+from symmetry_detection import (detect_reflection_axes, detect_rotational_symmetry,
+                                reflect_points_across_line, plot_paths_with_symmetry, save_paths_with_symmetry)
+from svg_stream import iter_svg_paths
+from complete_curves import complete_lines, plot_completed_curves, save_curves_to_svg
+from src.data_preparation.data_preparation import read_csv
+from custom_logger import instrumentation
+from result_cache import ResultCache, file_digest, result_key
+
+STAGES = ['regularize', 'symmetry', 'complete']
+INPUT_SUFFIXES = ('.svg', '.csv', '.curves')
+
+# One cache per worker process, so its in-process memo survives across files
+_caches = {}
+
+
+def find_inputs(inputs):
+    # Directories contribute every SVG/CSV/.curves file inside them; anything else is a glob
+    files = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            matches = [match for suffix in INPUT_SUFFIXES
+                       for match in glob.glob(os.path.join(pattern, '**', '*' + suffix), recursive=True)]
+        else:
+            matches = glob.glob(pattern, recursive=True)
+        files.extend(m for m in matches if m.lower().endswith(INPUT_SUFFIXES))
+    return sorted(set(files))
+
+
+def output_names(files):
+    # Prefix of every input's output files: its path under the inputs' common
+    # directory, suffix included, so frag0.csv and frag0.svg, or a/x.svg and
+    # b/x.svg, never write over each other
+    if not files:
+        return []
+    paths = [os.path.abspath(path) for path in files]
+    root = os.path.commonpath([os.path.dirname(path) for path in paths])
+    return [os.path.relpath(path, root) for path in paths]
+
+
+def load_drawing(input_path):
+    # Every path of the drawing as a SegmentArray
+    if input_path.lower().endswith(('.csv', '.curves')):
+        return [concatenate(SegmentArray.lines(XY[:-1], XY[1:]) for XY in XYs) for XYs in read_csv(input_path)]
+    return list(iter_svg_paths(input_path))
+
+
+def split_contiguous(segments):
+    # Regroups a flat SegmentArray into paths wherever a segment does not start
+    # where the previous one ended
+    if len(segments) == 0:
+        return []
+    breaks = np.flatnonzero(np.any(segments.start[1:] != segments.end[:-1], axis=1)) + 1
+    bounds = np.concatenate(([0], breaks, [len(segments)]))
+    return [segments[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def path_points(path, tolerance):
+    points, offsets = flatten_segments(path, tolerance)
+    return np.split(points, offsets[1:-1])
+
+
+def pack_result(paths=None, artifacts=None):
+    # A stage result as flat arrays for the result cache: the per-path
+    # SegmentArrays it produced, if any, and the bytes of its output files
+    arrays = {}
+    if paths is not None:
+        arrays['points'] = np.concatenate([path.points for path in paths]) if paths else np.empty((0, 4, 2))
+        arrays['kinds'] = np.concatenate([path.kinds for path in paths]) if paths else np.empty(0, dtype=np.int8)
+        arrays['offsets'] = np.cumsum([0] + [len(path) for path in paths])
+    for suffix, data in (artifacts or {}).items():
+        arrays['file' + suffix] = np.frombuffer(data, dtype=np.uint8)
+    return arrays
+
+
+def unpack_result(arrays):
+    paths = None
+    if 'offsets' in arrays:
+        segments = SegmentArray(arrays['points'], arrays['kinds'])
+        offsets = arrays['offsets']
+        paths = [segments[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+    artifacts = {name[len('file'):]: arrays[name].tobytes() for name in arrays if name.startswith('file')}
+    return paths, artifacts
+
+
+def run_stage(cache, key, compute):
+    # compute() returns (paths or None, {file suffix: bytes})
+    if cache is None:
+        return compute()
+    return cache.cached(key, compute, lambda result: pack_result(*result), unpack_result)
+
+
+def regularize_stage(paths):
+    segments = concatenate(paths)
+    with contextlib.redirect_stdout(io.StringIO()):
+        regularized = regularize_segments(segments)
+    size = int(np.ceil(np.abs(regularized.points).max()))
+    svg = io.StringIO()
+    save_segments_to_svg(regularized, svg, size)
+    return split_contiguous(regularized), {'_regularized.svg': svg.getvalue().encode()}
+
+
+def symmetry_stage(paths, tolerance):
+    path_XYs = [path_points(path, tolerance) for path in paths]
+    axes = detect_reflection_axes(path_XYs)
+    rotations = detect_rotational_symmetry(path_XYs)
+    report = []
+    for path_axes, (order, centre, score) in zip(axes, rotations):
+        report.append({
+            'reflection_axes': [{'point': point.tolist(), 'direction': direction.tolist(), 'residual': float(residual)}
+                                for point, direction, residual in path_axes],
+            'rotation': {'order': order, 'centre': None if centre is None else centre.tolist(), 'score': score},
+        })
+    reflected = [[reflect_points_across_line(segment, path_axes[0][0], path_axes[0][1]) for segment in path]
+                 for path, path_axes in zip(path_XYs, axes)]
+    png = io.BytesIO()
+    plot_paths_with_symmetry(path_XYs, reflected, ['r', 'g', 'b'], "detected", png, show=False)
+    svg = io.StringIO()
+    save_paths_with_symmetry(path_XYs, reflected, ['r', 'g', 'b'], svg)
+    return None, {'_symmetry.json': json.dumps(report, indent=2).encode(), '_symmetry.png': png.getvalue(),
+                  '_symmetry.svg': svg.getvalue().encode()}
+
+
+def complete_stage(paths, max_distance, tolerance, matching='nearest'):
+    lines = [LineString(flatten_path(path, tolerance)) for path in paths]
+    completed = complete_lines(lines, max_distance, matching)
+    png = io.BytesIO()
+    plot_completed_curves(lines, completed, png, show=False)
+    svg = io.StringIO()
+    save_curves_to_svg(completed, svg)
+    return None, {'_completed.png': png.getvalue(), '_completed.svg': svg.getvalue().encode()}
+
+
+def process_file(input_path, stages, out_dir, max_distance=10, tolerance=0.1, cache=None, matching='nearest',
+                 name=None):
+    # With a cache, every stage result is addressed by the input file's digest and
+    # the stages and parameters that led to it, so re-runs only redo what changed.
+    # Outputs are written to out_dir/<name><stage suffix>, name defaulting to the
+    # input's file name
+    name = name or os.path.basename(input_path)
+    timings = {}
+    key = file_digest(input_path) if cache is not None else None
+
+    start = time.perf_counter()
+    key = result_key(key, 'load')
+    paths, _ = run_stage(cache, key, lambda: ([path for path in load_drawing(input_path) if len(path)], {}))
+    timings['load'] = time.perf_counter() - start
+
+    for stage in STAGES:
+        if stage not in stages or not paths:
+            continue
+        start = time.perf_counter()
+        if stage == 'regularize':
+            key = result_key(key, stage)
+            new_paths, artifacts = run_stage(cache, key, lambda: regularize_stage(paths))
+            paths = new_paths
+        elif stage == 'symmetry':
+            stage_key = result_key(key, stage, {'tolerance': tolerance})
+            _, artifacts = run_stage(cache, stage_key, lambda: symmetry_stage(paths, tolerance))
+        else:
+            stage_key = result_key(key, stage, {'max_distance': max_distance, 'tolerance': tolerance,
+                                                'matching': matching})
+            _, artifacts = run_stage(cache, stage_key, lambda: complete_stage(paths, max_distance, tolerance, matching))
+        for suffix, data in artifacts.items():
+            output_path = os.path.join(out_dir, name + suffix)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            with open(output_path, 'wb') as f:
+                f.write(data)
+        timings[stage] = time.perf_counter() - start
+
+    return timings
+
+
+def _run(job):
+    input_path, name, stages, out_dir, max_distance, tolerance, cache_settings, instrument, matching = job
+    # Each file reports its own spans and counters back to the parent
+    if instrument:
+        instrumentation.configure(True)
+        instrumentation.reset()
+    cache = None
+    if cache_settings is not None:
+        if cache_settings not in _caches:
+            _caches[cache_settings] = ResultCache(*cache_settings)
+        cache = _caches[cache_settings]
+    try:
+        timings, error = process_file(input_path, stages, out_dir, max_distance, tolerance, cache, matching,
+                                      name), None
+    except Exception as e:
+        timings, error = {}, f'{type(e).__name__}: {e}'
+    return input_path, timings, error, instrumentation.summary() if instrument else None
+
+
+def run_batch(inputs, stages=STAGES, out_dir='batch_output', workers=None, max_distance=10, tolerance=0.1,
+              cache_dir='.result_cache', cache_bytes=1 << 30, instrument_output=None, matching='nearest'):
+    # cache_dir=None turns the result cache off
+    files = find_inputs(inputs)
+    os.makedirs(out_dir, exist_ok=True)
+    cache_settings = (cache_dir, cache_bytes) if cache_dir else None
+    jobs = [(path, name, list(stages), out_dir, max_distance, tolerance, cache_settings,
+             instrument_output is not None, matching) for path, name in zip(files, output_names(files))]
+    if instrument_output:
+        instrumentation.configure(True)
+        instrumentation.reset()
+
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for input_path, timings, error, summary in executor.map(_run, jobs):
+            if error:
+                print(f"Failed {input_path}: {error}")
+            if summary:
+                instrumentation.merge(summary)
+            results.append((input_path, timings, error))
+    wall_time = time.perf_counter() - start
+
+    print_summary(results, wall_time)
+    if instrument_output:
+        print()
+        instrumentation.report()
+        instrumentation.dump(instrument_output)
+    return results
+
+
+def print_summary(results, wall_time):
+    succeeded = sum(1 for _, _, error in results if error is None)
+    print(f"\nProcessed {succeeded}/{len(results)} files in {wall_time:.2f}s "
+          f"({len(results) / max(wall_time, 1e-9):.1f} files/s)")
+    print(f"{'stage':<12}{'files':>8}{'total s':>10}{'mean ms':>10}{'max ms':>10}")
+    for stage in ['load'] + STAGES:
+        times = np.array([timings[stage] for _, timings, _ in results if stage in timings])
+        if len(times):
+            print(f"{stage:<12}{len(times):>8}{times.sum():>10.2f}{times.mean() * 1000:>10.1f}{times.max() * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run regularize, symmetry and completion over many drawings.")
+    parser.add_argument('inputs', nargs='+', help="Directories or glob patterns of SVG/CSV/.curves files")
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help=f"Comma-separated subset of {', '.join(STAGES)}, run in that order")
+    parser.add_argument('--out-dir', default='batch_output',
+                        help="Outputs mirror the inputs' paths, suffix kept (frag0.svg -> frag0.svg_completed.svg)")
+    parser.add_argument('--workers', type=int, default=None, help="Maximum concurrent files (default: CPU count)")
+    parser.add_argument('--max-distance', type=float, default=10)
+    parser.add_argument('--tolerance', type=float, default=0.1, help="Curve flattening tolerance")
+    parser.add_argument('--matching', choices=['nearest', 'optimal'], default='nearest',
+                        help="Join each endpoint to its nearest neighbour, or pair endpoints one-to-one")
+    parser.add_argument('--cache-dir', default='.result_cache', help="On-disk cache of parsed inputs and stage results")
+    parser.add_argument('--cache-size-mb', type=float, default=1024, help="Least recently used results are evicted past this")
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--instrument', default=None, metavar='JSON',
+                        help="Collect spans and counters from every worker and save them to this file")
+    args = parser.parse_args()
+
+    stages = [stage for stage in STAGES if stage in args.stages.split(',')]
+    unknown = set(args.stages.split(',')) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+    run_batch(args.inputs, stages, args.out_dir, args.workers, args.max_distance, args.tolerance,
+              None if args.no_cache else args.cache_dir, int(args.cache_size_mb * 2 ** 20), args.instrument,
+              args.matching)
@@ -0,0 +1,68 @@
+import numpy as np
+
+SHAPES = ['circle', 'ellipse', 'rectangle', 'star', 'wave']
+CELL_SIZE = 100
+
+
+def shape_points(shape, num_points, rng):
+    # One closed outline (or an open wave) of num_points points in a unit cell
+    t = np.linspace(0, 2 * np.pi, num_points)
+    if shape == 'circle':
+        points = np.column_stack([np.cos(t), np.sin(t)])
+    elif shape == 'ellipse':
+        points = np.column_stack([np.cos(t), rng.uniform(0.3, 0.9) * np.sin(t)])
+    elif shape == 'rectangle':
+        # Square wave of the angle walks the four sides at constant speed
+        u = np.linspace(0, 4, num_points)
+        side = np.minimum(u.astype(int), 3)
+        f = 2 * (u - side) - 1
+        x = np.choose(side, [f, np.ones_like(f), -f, -np.ones_like(f)])
+        y = np.choose(side, [-np.ones_like(f), f, np.ones_like(f), -f])
+        points = np.column_stack([x, rng.uniform(0.4, 1.0) * y])
+    elif shape == 'star':
+        radius = 1 - 0.5 * (np.cos(5 * t) > 0)
+        points = np.column_stack([radius * np.cos(t), radius * np.sin(t)])
+    else:
+        points = np.column_stack([t / np.pi - 1, 0.3 * np.sin(rng.integers(1, 4) * t)])
+    return points
+
+
+def generate_drawing(num_paths, points_per_path=100, gap_density=0.2, seed=0):
+    # Drawing in read_csv's path_XYs layout with shapes laid out on a grid of
+    # CELL_SIZE cells. A gap_density fraction of the shapes is broken into two
+    # fragments a few units apart, which gives completion something to join.
+    rng = np.random.default_rng(seed)
+    columns = max(1, int(np.ceil(np.sqrt(num_paths))))
+    path_XYs = []
+    for i in range(num_paths):
+        shape = SHAPES[rng.integers(len(SHAPES))]
+        scale = CELL_SIZE * rng.uniform(0.25, 0.4)
+        centre = CELL_SIZE * (np.array([i % columns, i // columns]) + 0.5)
+        points = centre + scale * shape_points(shape, max(points_per_path, 8), rng)
+        points += rng.normal(0, 0.1, points.shape)
+        if rng.random() < gap_density:
+            cut = rng.integers(2, len(points) - 4)
+            gap = rng.integers(1, 3)
+            path_XYs.append([points[:cut]])
+            path_XYs.append([points[cut + gap:]])
+        else:
+            path_XYs.append([points])
+    return path_XYs
+
+
+def write_csv(path_XYs, csv_path):
+    rows = [np.column_stack([np.full(len(XY), p), np.full(len(XY), s), XY])
+            for p, XYs in enumerate(path_XYs) for s, XY in enumerate(XYs)]
+    np.savetxt(csv_path, np.concatenate(rows), delimiter=',', fmt=['%d', '%d', '%.4f', '%.4f'])
+
+
+def write_svg(path_XYs, svg_path):
+    # Every polyline becomes one path of line segments
+    size = CELL_SIZE * (int(np.ceil(np.sqrt(len(path_XYs)))) + 1)
+    with open(svg_path, 'w') as f:
+        f.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}">\n')
+        for XYs in path_XYs:
+            for XY in XYs:
+                commands = ' L '.join(f'{x:.4f},{y:.4f}' for x, y in XY)
+                f.write(f'<path d="M {commands}" fill="none" stroke="black"/>\n')
+        f.write('</svg>\n')
@@ -0,0 +1,268 @@
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.spatial import cKDTree
+from shapely.geometry import LineString
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(__file__))
+
+from run_benchmarks import metadata
+from segment_array import SegmentArray, concatenate
+from sampling import flatten_path
+from regularize import regularize_segments
+from complete_curves import complete_lines
+from batch_process import split_contiguous
+from src.data_preparation.data_preparation import read_csv
+
+
+def find_problems(problem_dir):
+    # Every input CSV with the solution it should turn into: "<name>_sol.csv"
+    # when it exists, otherwise a solution sharing the name's prefix whose
+    # digits include the input's (frag0 and frag1 both go to frag01_sol)
+    solutions = {os.path.basename(path)[:-len('_sol.csv')]: path
+                 for path in glob.glob(os.path.join(problem_dir, '*_sol.csv'))}
+    problems = []
+    for path in sorted(glob.glob(os.path.join(problem_dir, '*.csv'))):
+        name = os.path.basename(path)[:-len('.csv')]
+        if name.endswith('_sol'):
+            continue
+        solution = solutions.get(name)
+        if solution is None:
+            prefix, digits = re.fullmatch(r'(.*?)(\d*)', name).groups()
+            for stem, candidate in sorted(solutions.items()):
+                stem_prefix, stem_digits = re.fullmatch(r'(.*?)(\d*)', stem).groups()
+                if stem_prefix == prefix and digits and digits in stem_digits:
+                    solution = candidate
+                    break
+        if solution is not None:
+            problems.append((name, path, solution))
+    return problems
+
+
+# Every pipeline takes and returns a drawing as a list of paths, each a list of
+# (N, 2) polylines
+def run_input(path_XYs, max_distance):
+    return path_XYs
+
+
+def run_complete(path_XYs, max_distance, matching='nearest'):
+    lines = [LineString(XY) for XYs in path_XYs for XY in XYs if len(XY) > 1]
+    return [[np.asarray(curve.coords)] for curve in complete_lines(lines, max_distance, matching)]
+
+
+def run_complete_optimal(path_XYs, max_distance):
+    return run_complete(path_XYs, max_distance, 'optimal')
+
+
+def run_regularize(path_XYs, max_distance):
+    segments = concatenate(SegmentArray.lines(XY[:-1], XY[1:]) for XYs in path_XYs for XY in XYs if len(XY) > 1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        regularized = regularize_segments(segments)
+    return [[flatten_path(path)] for path in split_contiguous(regularized)]
+
+
+PIPELINES = {
+    'input': run_input,
+    'complete': run_complete,
+    'complete_optimal': run_complete_optimal,
+    'regularize': run_regularize,
+}
+
+
+def resample(paths, spacing):
+    # Points every `spacing` along every polyline of every path, all at once, and
+    # the path each point belongs to. Polylines are laid end to end on one arc
+    # length axis with a unit gap between them, so a single interpolation
+    # samples them all without ever landing between two polylines.
+    polylines = [np.asarray(XY, dtype=np.float64).reshape(-1, 2) for XYs in paths for XY in XYs if len(XY)]
+    path_of = np.array([i for i, XYs in enumerate(paths) for XY in XYs if len(XY)], dtype=np.int64)
+    if not polylines:
+        return np.empty((0, 2)), np.empty(0, dtype=np.int64)
+    points = np.concatenate(polylines)
+    counts = np.array([len(XY) for XY in polylines])
+    first = np.cumsum(counts) - counts
+    steps = np.linalg.norm(np.diff(points, axis=0), axis=1)
+    steps[first[1:] - 1] = 0
+    arc = np.concatenate(([0.0], np.cumsum(steps)))
+    lengths = arc[first + counts - 1] - arc[first]
+    arc += np.repeat(np.arange(len(polylines)), counts)
+    samples = np.ceil(lengths / spacing).astype(np.int64) + 1
+    owner = np.repeat(np.arange(len(polylines)), samples)
+    step = np.arange(samples.sum()) - np.repeat(np.cumsum(samples) - samples, samples)
+    positions = arc[first][owner] + lengths[owner] * step / np.maximum(samples - 1, 1)[owner]
+    resampled = np.stack([np.interp(positions, arc, points[:, 0]), np.interp(positions, arc, points[:, 1])], axis=1)
+    return resampled, path_of[owner]
+
+
+def path_distances(points, ids, num_paths, other_points, other_ids, num_other, candidates):
+    # Mean distance from each path's points to each candidate path of the other
+    # drawing, as a (num_paths, num_other) matrix that is inf elsewhere
+    distances = np.full((num_paths, num_other), np.inf)
+    order = np.argsort(ids, kind='stable')
+    bounds = np.searchsorted(ids[order], np.arange(num_paths + 1))
+    other_order = np.argsort(other_ids, kind='stable')
+    other_bounds = np.searchsorted(other_ids[other_order], np.arange(num_other + 1))
+    for j in np.flatnonzero(candidates.any(axis=0)):
+        rows = np.flatnonzero(candidates[:, j])
+        tree = cKDTree(other_points[other_order[other_bounds[j]:other_bounds[j + 1]]])
+        selected = np.concatenate([order[bounds[i]:bounds[i + 1]] for i in rows])
+        nearest, _ = tree.query(points[selected])
+        sums = np.bincount(ids[selected], weights=nearest, minlength=num_paths)
+        distances[rows, j] = sums[rows] / np.diff(bounds)[rows]
+    return distances
+
+
+def score(output, solution, spacing=None, match_distance=None):
+    # Chamfer (mean of both directed mean distances) and Hausdorff distances
+    # between the two drawings, plus a one-to-one matching of their paths by
+    # per-path Chamfer distance. Paths further apart than `match_distance` stay
+    # unmatched. Both distances default to fractions of the solution's diagonal.
+    solution_points = np.concatenate([np.asarray(XY).reshape(-1, 2) for XYs in solution for XY in XYs])
+    diagonal = float(np.linalg.norm(solution_points.max(axis=0) - solution_points.min(axis=0)))
+    spacing = spacing or diagonal / 500
+    match_distance = match_distance or diagonal / 50
+    A, a_ids = resample(output, spacing)
+    B, b_ids = resample(solution, spacing)
+    if not len(A):
+        return {'chamfer': None, 'hausdorff': None, 'diagonal': diagonal, 'paths': 0,
+                'solution_paths': len(solution), 'matched_paths': 0, 'matched_chamfer': None}
+    a_to_b, _ = cKDTree(B).query(A)
+    b_to_a, _ = cKDTree(A).query(B)
+
+    # A path pair's Chamfer distance is at least the gap between their bounds,
+    # so only pairs whose bounds come within match_distance are measured
+    num_a, num_b = len(output), len(solution)
+    a_low = np.full((num_a, 2), np.inf)
+    a_high = np.full((num_a, 2), -np.inf)
+    np.minimum.at(a_low, a_ids, A)
+    np.maximum.at(a_high, a_ids, A)
+    b_low = np.full((num_b, 2), np.inf)
+    b_high = np.full((num_b, 2), -np.inf)
+    np.minimum.at(b_low, b_ids, B)
+    np.maximum.at(b_high, b_ids, B)
+    gaps = np.maximum(0, np.maximum(a_low[:, None] - b_high[None], b_low[None] - a_high[:, None])).max(axis=2)
+    candidates = gaps <= match_distance
+    costs = (path_distances(A, a_ids, num_a, B, b_ids, num_b, candidates) +
+             path_distances(B, b_ids, num_b, A, a_ids, num_a, candidates.T).T) / 2
+    rows, cols = linear_sum_assignment(np.where(costs <= match_distance, costs, 1e9 * (1 + match_distance)))
+    matched = costs[rows, cols] <= match_distance
+    return {
+        'chamfer': float((a_to_b.mean() + b_to_a.mean()) / 2),
+        'hausdorff': float(max(a_to_b.max(), b_to_a.max())),
+        'diagonal': diagonal,
+        'paths': num_a,
+        'solution_paths': num_b,
+        'matched_paths': int(matched.sum()),
+        'matched_chamfer': float(costs[rows, cols][matched].mean()) if matched.any() else None,
+    }
+
+
+def evaluate(job):
+    name, input_path, solution_path, pipeline, max_distance = job
+    start = time.perf_counter()
+    try:
+        output = PIPELINES[pipeline](read_csv(input_path), max_distance)
+        elapsed = time.perf_counter() - start
+        result = score(output, read_csv(solution_path))
+        error = None
+    except Exception as e:
+        elapsed, result, error = time.perf_counter() - start, {}, f'{type(e).__name__}: {e}'
+    return {'problem': name, 'pipeline': pipeline, 'input': os.path.relpath(input_path, ROOT),
+            'solution': os.path.relpath(solution_path, ROOT), 'max_distance': max_distance,
+            'time_s': elapsed, 'error': error, **result}
+
+
+def run_evaluation(problems, pipelines, max_distance=10, workers=None):
+    jobs = [(name, input_path, solution_path, pipeline, max_distance)
+            for name, input_path, solution_path in problems for pipeline in pipelines]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(evaluate, jobs))
+
+
+def print_table(results):
+    def number(value, width, digits=3):
+        return f"{value:>{width}.{digits}f}" if value is not None else f"{'-':>{width}}"
+    print(f"{'problem':<16}{'pipeline':<18}{'chamfer':>10}{'hausdorff':>11}{'paths':>7}{'sol':>5}"
+          f"{'matched':>9}{'path chamfer':>14}{'ms':>9}")
+    for r in results:
+        if r['error']:
+            print(f"{r['problem']:<16}{r['pipeline']:<18}failed: {r['error']}")
+            continue
+        print(f"{r['problem']:<16}{r['pipeline']:<18}{number(r['chamfer'], 10)}{number(r['hausdorff'], 11)}"
+              f"{r['paths']:>7}{r['solution_paths']:>5}{r['matched_paths']:>9}{number(r['matched_chamfer'], 14)}"
+              f"{r['time_s'] * 1000:>9.1f}")
+
+
+def compare(results, baseline_path, slack=0.05):
+    # Regressions against an earlier run: a failure, a Chamfer or Hausdorff
+    # distance more than `slack` (relative) worse, or fewer matched paths
+    with open(baseline_path) as f:
+        baseline = {(r['problem'], r['pipeline']): r for r in json.load(f)['results']}
+    regressions = []
+    for r in results:
+        previous = baseline.get((r['problem'], r['pipeline']))
+        if previous is None or previous['error']:
+            continue
+        key = f"{r['problem']}/{r['pipeline']}"
+        if r['error']:
+            regressions.append(f"{key} failed: {r['error']}")
+            continue
+        for metric in ('chamfer', 'hausdorff'):
+            if previous[metric] is not None and (r[metric] is None or
+                                                 r[metric] > previous[metric] * (1 + slack) + 1e-9):
+                regressions.append(f"{key} {metric} {previous[metric]:.3f} -> {r[metric]}")
+        if r['matched_paths'] < previous['matched_paths']:
+            regressions.append(f"{key} matched paths {previous['matched_paths']} -> {r['matched_paths']}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score pipelines against the *_sol ground truth of every problem.")
+    parser.add_argument('--problems', default=os.path.join(ROOT, 'data', 'problems'),
+                        help="Directory of input CSVs and their *_sol.csv solutions")
+    parser.add_argument('--pipelines', default=','.join(PIPELINES),
+                        help=f"Comma-separated subset of {', '.join(PIPELINES)}")
+    parser.add_argument('--max-distance', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default=None,
+                        help="JSON file (default: benchmarks/results/evaluation-<timestamp>.json)")
+    parser.add_argument('--baseline', default=None, help="Earlier evaluation JSON; exits with 1 on any regression")
+    parser.add_argument('--slack', type=float, default=0.05, help="Relative distance increase tolerated by --baseline")
+    args = parser.parse_args()
+
+    pipelines = args.pipelines.split(',')
+    unknown = set(pipelines) - set(PIPELINES)
+    if unknown:
+        parser.error(f"Unknown pipelines: {', '.join(sorted(unknown))}")
+    problems = find_problems(args.problems)
+    if not problems:
+        parser.error(f"No input/solution pairs found in {args.problems}")
+
+    results = run_evaluation(problems, pipelines, args.max_distance, args.workers)
+    print_table(results)
+
+    output = args.output or os.path.join(os.path.dirname(__file__), 'results',
+                                         'evaluation-' + time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'metadata': metadata(), 'results': results}, f, indent=2)
+    print(f"Saved results to {output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.slack)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
@@ -0,0 +1,211 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+from svgpathtools import svg2paths
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(__file__))
+
+from drawings import generate_drawing, write_csv, write_svg
+from regularize import svg_to_segments, regularize_segments
+from symmetry_detection import find_symmetry_and_reflect
+from complete_curves import complete_curves
+from src.data_preparation.data_preparation import read_csv, rasterize_drawings
+from src.numpy_inference import NumpyModel
+
+
+def random_classifier(img_size=64, num_classes=7, seed=0):
+    # Same layer stack as model.create_model with random weights, so inference
+    # can be timed without TensorFlow or a trained model
+    rng = np.random.default_rng(seed)
+    layers, weights = [], {}
+    channels, size = 1, img_size
+    for filters in (32, 64, 128):
+        weights[len(layers)] = (rng.normal(0, 0.1, (3, 3, channels, filters)).astype(np.float32),
+                                np.zeros(filters, dtype=np.float32))
+        layers.append({'type': 'Conv2D', 'activation': 'relu'})
+        layers.append({'type': 'MaxPooling2D', 'pool_size': [2, 2], 'strides': [2, 2]})
+        channels, size = filters, (size - 2) // 2
+    layers.append({'type': 'Flatten'})
+    for units, activation in ((128, 'relu'), (num_classes, 'softmax')):
+        inputs = size * size * channels if activation == 'relu' else 128
+        weights[len(layers)] = (rng.normal(0, 0.01, (inputs, units)).astype(np.float32),
+                                np.zeros(units, dtype=np.float32))
+        layers.append({'type': 'Dense', 'activation': activation})
+    return NumpyModel(layers, weights)
+
+
+def quiet(function, *args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args)
+
+
+# Each setup writes/loads its inputs outside the timed region and returns the
+# callable to time. `size` is the number of paths in the generated drawing.
+def setup_read_csv(path_XYs, work_dir):
+    csv_path = os.path.join(work_dir, 'drawing.csv')
+    write_csv(path_XYs, csv_path)
+    return lambda: read_csv(csv_path)
+
+
+def setup_regularize(path_XYs, work_dir):
+    svg_path = os.path.join(work_dir, 'drawing.svg')
+    write_svg(path_XYs, svg_path)
+    return lambda: quiet(regularize_segments, quiet(svg_to_segments, svg_path))
+
+
+def setup_symmetry(path_XYs, work_dir):
+    return lambda: find_symmetry_and_reflect(path_XYs, "detected")
+
+
+def setup_complete(path_XYs, work_dir):
+    svg_path = os.path.join(work_dir, 'drawing.svg')
+    write_svg(path_XYs, svg_path)
+    paths, _ = svg2paths(svg_path)
+    return lambda: complete_curves(paths)
+
+
+def path_images(path_XYs):
+    # One drawing (in read_csv's nested form) per path, each fitted to its own image
+    return [[XYs] for XYs in path_XYs]
+
+
+def check_images(images):
+    if not images.max(axis=(1, 2)).all():
+        raise AssertionError("Rasterized benchmark drawings came out blank")
+    return images
+
+
+def setup_rasterize(path_XYs, work_dir):
+    drawings = path_images(path_XYs)
+    check_images(rasterize_drawings(drawings, 64, fit=True))
+    return lambda: rasterize_drawings(drawings, 64, fit=True)
+
+
+def setup_inference(path_XYs, work_dir):
+    images = check_images(rasterize_drawings(path_images(path_XYs), 64, fit=True))[..., None] / np.float32(255.0)
+    model = random_classifier()
+    return lambda: model.predict(images)
+
+
+BENCHMARKS = {
+    'read_csv': setup_read_csv,
+    'regularize': setup_regularize,
+    'symmetry': setup_symmetry,
+    'complete': setup_complete,
+    'rasterize': setup_rasterize,
+    'inference': setup_inference,
+}
+
+
+def measure(function, repeats=3):
+    function()  # Warm-up: imports, caches, first-touch allocations
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    # Peak memory is taken from a separate run, as tracing slows allocation down
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return times, peak
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_benchmarks(names, sizes, points_per_path=100, gap_density=0.2, repeats=3, seed=0):
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in sizes:
+            path_XYs = generate_drawing(size, points_per_path, gap_density, seed)
+            num_points = sum(len(XY) for XYs in path_XYs for XY in XYs)
+            for name in names:
+                times, peak = measure(BENCHMARKS[name](path_XYs, work_dir), repeats)
+                result = {
+                    'benchmark': name,
+                    'size': size,
+                    'num_points': num_points,
+                    'points_per_path': points_per_path,
+                    'gap_density': gap_density,
+                    'times_s': times,
+                    'median_s': float(np.median(times)),
+                    'best_s': min(times),
+                    'peak_memory_bytes': peak,
+                }
+                results.append(result)
+                print(f"{name:<12}{size:>8}{num_points:>10}{result['median_s'] * 1000:>12.2f}"
+                      f"{peak / 2 ** 20:>12.2f}")
+    return results
+
+
+def compare(results, baseline_path):
+    # Ratio of median times against an earlier run; > 1 means slower now
+    with open(baseline_path) as f:
+        baseline = {(r['benchmark'], r['size']): r for r in json.load(f)['results']}
+    print(f"\nCompared with {baseline_path}")
+    print(f"{'benchmark':<12}{'size':>8}{'time x':>10}{'memory x':>10}")
+    for result in results:
+        previous = baseline.get((result['benchmark'], result['size']))
+        if previous:
+            time_ratio = result['median_s'] / max(previous['median_s'], 1e-12)
+            memory_ratio = result['peak_memory_bytes'] / max(previous['peak_memory_bytes'], 1)
+            print(f"{result['benchmark']:<12}{result['size']:>8}{time_ratio:>10.2f}{memory_ratio:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time every geometry stage against synthetic drawings of growing size.")
+    parser.add_argument('--benchmarks', default=','.join(BENCHMARKS),
+                        help=f"Comma-separated subset of {', '.join(BENCHMARKS)}")
+    parser.add_argument('--sizes', default='10,100,1000', help="Comma-separated numbers of paths per drawing")
+    parser.add_argument('--points-per-path', type=int, default=100)
+    parser.add_argument('--gap-density', type=float, default=0.2, help="Fraction of shapes split into two fragments")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="JSON file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument('--compare', default=None, help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    names = args.benchmarks.split(',')
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    print(f"{'benchmark':<12}{'size':>8}{'points':>10}{'median ms':>12}{'peak MiB':>12}")
+    results = run_benchmarks(names, sizes, args.points_per_path, args.gap_density, args.repeats, args.seed)
+
+    output = args.output or os.path.join(os.path.dirname(__file__), 'results', time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'metadata': metadata(), 'results': results}, f, indent=2)
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
@@ -0,0 +1,220 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from segment_array import SegmentArray, CUBIC, concatenate
+from svg_writer import SVGWriter
+from custom_logger import instrumentation
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _bernstein(u):
+    mt = 1 - u
+    return np.stack([mt ** 3, 3 * mt * mt * u, 3 * mt * u * u, u ** 3], axis=1)
+
+
+def _piece_layout(lo, hi):
+    # Flat indices of every point of every piece, the piece each belongs to, and
+    # where each piece starts within the flat layout
+    counts = hi - lo + 1
+    first = np.cumsum(counts) - counts
+    piece = np.repeat(np.arange(len(lo)), counts)
+    index = np.arange(counts.sum()) - first[piece] + lo[piece]
+    return piece, index, first, counts
+
+
+def _chord_parameters(arc_lengths, piece, index, lo, hi):
+    # Chord-length parameters from the arc length along each whole polyline, so a
+    # piece's parameters do not depend on which other pieces share the batch
+    spans = arc_lengths[hi] - arc_lengths[lo]
+    return (arc_lengths[index] - arc_lengths[lo][piece]) / np.where(spans == 0, 1, spans)[piece]
+
+
+def _generate_beziers(points, piece, index, u, lo, hi, left_tangents, right_tangents):
+    # Least-squares lengths of the two end tangents for every piece at once
+    # (Schneider, "An Algorithm for Automatically Fitting Digitized Curves")
+    p0, p3 = points[lo], points[hi]
+    basis = _bernstein(u)
+    a1 = left_tangents[piece] * basis[:, 1:2]
+    a2 = right_tangents[piece] * basis[:, 2:3]
+    rest = points[index] - (p0[piece] * (basis[:, 0:1] + basis[:, 1:2]) + p3[piece] * (basis[:, 2:3] + basis[:, 3:4]))
+
+    def piece_sum(values):
+        return np.bincount(piece, weights=values.sum(axis=1), minlength=len(lo))
+    c00, c01, c11 = piece_sum(a1 * a1), piece_sum(a1 * a2), piece_sum(a2 * a2)
+    x0, x1 = piece_sum(a1 * rest), piece_sum(a2 * rest)
+    det = c00 * c11 - c01 * c01
+    safe_det = np.where(det == 0, 1, det)
+    alpha_left = np.where(det == 0, 0, (x0 * c11 - x1 * c01) / safe_det)
+    alpha_right = np.where(det == 0, 0, (c00 * x1 - c01 * x0) / safe_det)
+
+    # Degenerate or backwards solutions fall back to a third of the chord
+    chord = np.linalg.norm(p3 - p0, axis=1)
+    fallback = (alpha_left < 1e-6 * chord) | (alpha_right < 1e-6 * chord)
+    alpha_left = np.where(fallback, chord / 3, alpha_left)
+    alpha_right = np.where(fallback, chord / 3, alpha_right)
+    return np.stack([p0, p0 + left_tangents * alpha_left[:, None],
+                     p3 + right_tangents * alpha_right[:, None], p3], axis=1)
+
+
+def _max_errors(points, piece, index, first, counts, u, controls):
+    # Largest squared distance of each piece's interior points from its curve,
+    # and the flat index of the point where it occurs
+    fitted = np.einsum('nk,nkd->nd', _bernstein(u), controls[piece])
+    errors = ((fitted - points[index]) ** 2).sum(axis=1)
+    errors[first] = 0
+    errors[first + counts - 1] = 0
+    max_errors = np.maximum.reduceat(errors, first)
+    at_max = np.flatnonzero(errors == max_errors[piece])
+    _, first_at_max = np.unique(piece[at_max], return_index=True)
+    return max_errors, index[at_max[first_at_max]]
+
+
+def _reparameterize(points, piece, index, u, controls):
+    # One Newton-Raphson step towards the parameter of each point's closest
+    # position on its piece's curve
+    c = controls[piece]
+    mt = (1 - u)[:, None]
+    t = u[:, None]
+    d1, d2, d3 = 3 * (c[:, 1] - c[:, 0]), 3 * (c[:, 2] - c[:, 1]), 3 * (c[:, 3] - c[:, 2])
+    first_derivative = mt * mt * d1 + 2 * mt * t * d2 + t * t * d3
+    second_derivative = mt * 2 * (d2 - d1) + t * 2 * (d3 - d2)
+    difference = np.einsum('nk,nkd->nd', _bernstein(u), c) - points[index]
+    numerator = (difference * first_derivative).sum(axis=1)
+    denominator = (first_derivative ** 2).sum(axis=1) + (difference * second_derivative).sum(axis=1)
+    return np.where(denominator == 0, u, u - numerator / np.where(denominator == 0, 1, denominator))
+
+
+def fit_polylines(polylines, error=1.0, max_iterations=4):
+    # Fits every (N, 2) polyline with a G1-continuous sequence of cubic Béziers
+    # that stays within `error` (in drawing units) of every point. All pieces at
+    # the same depth of the recursive subdivision are fitted together; a piece
+    # that misses the tolerance by less than 2x is first reparameterized up to
+    # `max_iterations` times, otherwise it is split at its worst point with a
+    # shared tangent there. Returns one SegmentArray of CUBIC segments per polyline.
+    cleaned = []
+    for XY in polylines:
+        XY = np.asarray(XY, dtype=np.float64).reshape(-1, 2)
+        if len(XY):
+            # Repeated points have no tangent
+            XY = XY[np.concatenate(([True], np.any(XY[1:] != XY[:-1], axis=1)))]
+        cleaned.append(XY)
+    lengths = np.array([len(XY) for XY in cleaned], dtype=np.int64)
+    starts = np.cumsum(lengths) - lengths
+    points = np.concatenate(cleaned) if cleaned else np.empty((0, 2))
+    fitted = lengths >= 2
+    arc_lengths = np.concatenate([np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(XY, axis=0), axis=1))))
+                                  for XY in cleaned]) if cleaned else np.empty(0)
+
+    lo = starts[fitted]
+    hi = (starts + lengths - 1)[fitted]
+    left_tangents = _normalize(points[lo + 1] - points[lo])
+    right_tangents = _normalize(points[hi - 1] - points[hi])
+    tolerance = error ** 2
+    result_starts, result_controls = [], []
+    while len(lo):
+        piece, index, first, counts = _piece_layout(lo, hi)
+        u = _chord_parameters(arc_lengths, piece, index, lo, hi)
+        controls = _generate_beziers(points, piece, index, u, lo, hi, left_tangents, right_tangents)
+        max_errors, splits = _max_errors(points, piece, index, first, counts, u, controls)
+        accepted = max_errors < tolerance
+
+        # Only the pieces close to the tolerance are reparameterized and refitted
+        active = np.flatnonzero(~accepted & (max_errors < 4 * tolerance))
+        active_u = u[np.isin(piece, active)]
+        for _ in range(max_iterations):
+            if not len(active):
+                break
+            a_lo, a_hi = lo[active], hi[active]
+            a_piece, a_index, a_first, a_counts = _piece_layout(a_lo, a_hi)
+            active_u = _reparameterize(points, a_piece, a_index, active_u, controls[active])
+            controls[active] = _generate_beziers(points, a_piece, a_index, active_u, a_lo, a_hi,
+                                                 left_tangents[active], right_tangents[active])
+            max_errors[active], splits[active] = _max_errors(points, a_piece, a_index, a_first, a_counts,
+                                                             active_u, controls[active])
+            done = max_errors[active] < tolerance
+            accepted[active[done]] = True
+            active_u = active_u[~done[a_piece]]
+            active = active[~done]
+        result_starts.append(lo[accepted])
+        result_controls.append(controls[accepted])
+
+        # Everything else splits at its worst point, sharing one tangent there
+        split = ~accepted
+        s = splits[split]
+        centre = _normalize(points[s - 1] - points[s + 1])
+        cusp = np.all(centre == 0, axis=1)
+        centre[cusp] = _normalize(points[s - 1][cusp] - points[s][cusp])
+        lo, hi = np.concatenate([lo[split], s]), np.concatenate([s, hi[split]])
+        left_tangents = np.concatenate([left_tangents[split], -centre])
+        right_tangents = np.concatenate([centre, right_tangents[split]])
+
+    instrumentation.count('bezier_points_fitted', len(points))
+    all_starts = np.concatenate(result_starts) if result_starts else np.empty(0, dtype=np.int64)
+    all_controls = np.concatenate(result_controls) if result_controls else np.empty((0, 4, 2))
+    instrumentation.count('bezier_segments_fitted', len(all_starts))
+    # Pieces partition their polylines, so ordering by start point restores the
+    # curve order within every polyline
+    order = np.argsort(all_starts, kind='stable')
+    all_starts, all_controls = all_starts[order], all_controls[order]
+    bounds = np.searchsorted(all_starts, np.concatenate((starts, [len(points)])))
+    return [SegmentArray(all_controls[a:b], np.full(b - a, CUBIC, dtype=np.int8))
+            for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def _fit_chunk(path_XYs, error, max_iterations):
+    polylines = [XY for XYs in path_XYs for XY in XYs]
+    fitted = fit_polylines(polylines, error, max_iterations)
+    bounds = np.cumsum([0] + [len(XYs) for XYs in path_XYs])
+    return [concatenate(fitted[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+@instrumentation.timed('bezier_fit.fit_paths')
+def fit_paths(path_XYs, error=1.0, max_iterations=4, workers=None, chunk_size=256):
+    # Drawing in read_csv's path_XYs layout to one SegmentArray per path. Paths
+    # are fitted in chunks of `chunk_size`, spread over a process pool when there
+    # is more than one chunk and `workers` is not 1.
+    chunks = [path_XYs[start:start + chunk_size] for start in range(0, len(path_XYs), chunk_size)]
+    if len(chunks) <= 1 or workers == 1:
+        return [path for chunk in chunks for path in _fit_chunk(chunk, error, max_iterations)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        fitted = executor.map(_fit_chunk, chunks, [error] * len(chunks), [max_iterations] * len(chunks))
+        return [path for chunk in fitted for path in chunk]
+
+
+def save_fitted_svg(paths, svg_path, precision=3):
+    points = np.concatenate([path.points.reshape(-1, 2) for path in paths]) if paths else np.zeros((1, 2))
+    width, height = np.ceil(points.max(axis=0)).astype(int) + 1
+    with SVGWriter(svg_path, width, height, precision) as svg:
+        for path in paths:
+            svg.write_segments(path)
+
+
+if __name__ == "__main__":
+    from src.data_preparation.data_preparation import read_csv
+
+    parser = argparse.ArgumentParser(description="Fit the polylines of a CSV drawing with cubic Bézier curves.")
+    parser.add_argument('input_csv')
+    parser.add_argument('output_svg', nargs='?', default=None)
+    parser.add_argument('--error', type=float, default=1.0, help="Largest allowed distance from any input point")
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    path_XYs = read_csv(args.input_csv)
+    paths = fit_paths(path_XYs, args.error, workers=args.workers)
+    num_points = sum(len(XY) for XYs in path_XYs for XY in XYs)
+    num_segments = sum(len(path) for path in paths)
+    # Every contiguous run of segments adds its start point to the 3 new
+    # control points per segment; a run breaks wherever a segment does not
+    # start at the previous one's end
+    num_runs = sum(1 + int(np.any(path.start[1:] != path.end[:-1], axis=1).sum()) for path in paths if len(path))
+    print(f"Fitted {num_points} points with {num_segments} cubic segments "
+          f"({3 * num_segments + num_runs} control points)")
+    output_svg = args.output_svg or os.path.splitext(os.path.basename(args.input_csv))[0] + '_fitted.svg'
+    save_fitted_svg(paths, output_svg)
+    print(f"Fitted SVG saved to {output_svg}")
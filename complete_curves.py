@@ -1,45 +1,235 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
 import numpy as np
 import matplotlib.pyplot as plt
-from svgpathtools import svg2paths2, Path
+import shapely
 from shapely.geometry import LineString, Point, MultiLineString
+from shapely.strtree import STRtree
 from shapely.ops import linemerge, unary_union
 from scipy.spatial import cKDTree
+from scipy.sparse import coo_matrix, csr_matrix
+from scipy.optimize import milp, Bounds, LinearConstraint
+from scipy.sparse.csgraph import connected_components
+from sampling import sample_path
+from svg_writer import SVGWriter
+from svg_stream import iter_svg_paths
+from custom_logger import instrumentation
+
+# Groups of candidate endpoints up to this size are matched by enumeration,
+# larger ones with SciPy's MILP solver
+EXACT_MATCHING_SIZE = 14
+# Seconds the solver may spend on one group before settling for the best
+# matching it has found
+MATCHING_TIME_LIMIT = 10.0
 
 def svg_to_paths(svg_file):
-    paths, _, _ = svg2paths2(svg_file)
-    return paths
+    return list(iter_svg_paths(svg_file))
 
 def path_to_line(path, num_points=100):
-    t = np.linspace(0, 1, num_points)
-    points = np.array([path.point(ti) for ti in t])
-    return LineString([(float(p.real), float(p.imag)) for p in points])
+    return LineString(sample_path(path, num_points))
 
-def complete_curves(paths, max_distance=5):
+def complete_curves(paths, max_distance=5, tiled=False, tile_size=None, workers=None, matching='nearest'):
     lines = [path_to_line(path) for path in paths]
-    
+    if tiled:
+        if matching != 'nearest':
+            raise ValueError("Tiled completion only supports matching='nearest'")
+        return complete_lines_tiled(lines, max_distance, tile_size, workers)
+    return complete_lines(lines, max_distance, matching)
+
+def nearest_endpoints(points, queries, max_distance):
+    # Index of the nearest other point to each of points[queries], or -1 when
+    # none is within max_distance, and its distance. A point is told apart from
+    # itself by index rather than by coming first, and equally near points go to
+    # the lowest index: snapped coordinates tie all the time, and a KD-tree
+    # returns ties in the order of its own layout, which differs between trees.
+    n = len(points)
+    nearest = np.full(len(queries), -1, dtype=np.int64)
+    nearest_distance = np.full(len(queries), np.inf)
+    tree = cKDTree(points)
+    pending = np.arange(len(queries))
+    k = 3
+    while len(pending):
+        k = min(k, n)
+        distances, indices = tree.query(points[queries[pending]], k=k)
+        distances, indices = distances.reshape(len(pending), k), indices.reshape(len(pending), k)
+        others = indices != queries[pending, None]
+        distance = np.where(others, distances, np.inf).min(axis=1)
+        nearest[pending] = np.where(others & (distances == distance[:, None]), indices, n).min(axis=1)
+        nearest_distance[pending] = distance
+        # When the last neighbour returned is still a tie, more may lie beyond it
+        pending = pending[(distance <= max_distance) & (distances[:, -1] == distance)] if k < n else pending[:0]
+        k *= 2
+    nearest[nearest_distance > max_distance] = -1
+    return nearest, nearest_distance
+
+@instrumentation.timed('complete_curves.complete_lines')
+def complete_lines(lines, max_distance=5, matching='nearest'):
+    # matching='nearest' joins every endpoint to its nearest neighbour;
+    # 'optimal' pairs endpoints one-to-one with match_endpoints
+    if matching == 'optimal':
+        sources, targets = match_endpoints(lines, max_distance)
+        endpoints = np.array([(line.coords[0], line.coords[-1]) for line in lines]).reshape(-1, 2)
+        connections = list(shapely.linestrings(np.stack([endpoints[sources], endpoints[targets]], axis=1))) \
+            if len(sources) else []
+        instrumentation.count('connections_made', len(connections))
+        return merge_and_close(lines + connections, max_distance)
+    if matching != 'nearest':
+        raise ValueError(f"Unknown matching {matching!r}, expected 'nearest' or 'optimal'")
+
     # Extract all endpoints
-    endpoints = []
-    for line in lines:
-        endpoints.extend([Point(line.coords[0]), Point(line.coords[-1])])
+    endpoints = np.array([(line.coords[0], line.coords[-1]) for line in lines]).reshape(-1, 2)
     
-    # Build KD-tree for efficient nearest neighbor search
-    tree = cKDTree([(p.x, p.y) for p in endpoints])
+    # Nearest other endpoint of every endpoint, from a KD-tree
+    nearest_index, _ = nearest_endpoints(endpoints, np.arange(len(endpoints)), max_distance)
     
-    connections = []
-    for i, p in enumerate(endpoints):
-        distances, indices = tree.query((p.x, p.y), k=2)  # Find the nearest point (excluding self)
-        nearest_index = indices[1]
-        nearest_distance = distances[1]
-        
-        if nearest_distance <= max_distance:
-            nearest_point = endpoints[nearest_index]
-            connection = LineString([p, nearest_point])
-            if not any(existing_line.crosses(connection) for existing_line in lines):
-                connections.append(connection)
+    candidates = np.flatnonzero(nearest_index >= 0)
+    candidate_connections = shapely.linestrings(
+        np.stack([endpoints[candidates], endpoints[nearest_index[candidates]]], axis=1))
     
+    # Test all candidates at once, each only against the lines whose bounds it intersects
+    line_index = STRtree(lines)
+    crossing, _ = line_index.query(candidate_connections, predicate='crosses')
+    keep = np.ones(len(candidate_connections), dtype=bool)
+    keep[crossing] = False
+    connections = list(candidate_connections[keep])
+    instrumentation.count('connections_tested', len(candidate_connections))
+    instrumentation.count('connections_made', len(connections))
+    
+    return merge_and_close(lines + connections, max_distance)
+
+def endpoint_tangents(lines):
+    # Unit direction pointing out of each endpoint along its line, in the same
+    # 2 * line + end order as the endpoints
+    coords = [np.asarray(line.coords) for line in lines]
+    outward = np.array([(XY[0] - XY[1], XY[-1] - XY[-2]) for XY in coords]).reshape(-1, 2)
+    norms = np.linalg.norm(outward, axis=1, keepdims=True)
+    return outward / np.where(norms == 0, 1, norms)
+
+@instrumentation.timed('complete_curves.match_endpoints')
+def match_endpoints(lines, max_distance=5, tangent_weight=1.0):
+    # Pairs endpoints one-to-one so the total cost of the gaps bridged is lowest.
+    # Every pair of endpoints of different lines within max_distance is a
+    # candidate, costing its length over max_distance plus tangent_weight times
+    # how far the bridge turns away from both lines' directions (0 when it
+    # continues both straight on, 1 when it doubles back). Leaving an endpoint
+    # open costs more than any candidate. Each connected group of candidates is
+    # matched on its own, exactly unless the solver runs out of
+    # MATCHING_TIME_LIMIT on it. Connections that cross a line are removed from
+    # the candidates and the groups they were in solved again, so Shapely
+    # mostly tests only the connections actually chosen; groups left to the
+    # solver have all their candidates tested first, so each is solved once.
+    # Returns (sources, targets) endpoint indices with sources < targets.
+    endpoints = np.array([(line.coords[0], line.coords[-1]) for line in lines]).reshape(-1, 2)
+    n = len(endpoints)
+    pairs = cKDTree(endpoints).query_pairs(max_distance, output_type='ndarray').reshape(-1, 2)
+    pairs = pairs[pairs[:, 0] // 2 != pairs[:, 1] // 2]
+    if not len(pairs):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    tangents = endpoint_tangents(lines)
+    gaps = endpoints[pairs[:, 1]] - endpoints[pairs[:, 0]]
+    distances = np.linalg.norm(gaps, axis=1)
+    directions = gaps / np.where(distances == 0, 1, distances)[:, None]
+    turning = ((1 - (tangents[pairs[:, 0]] * directions).sum(axis=1)) / 2 +
+               (1 + (tangents[pairs[:, 1]] * directions).sum(axis=1)) / 2) / 2
+    turning[distances == 0] = 0
+    costs = distances / max(max_distance, 1e-12) + tangent_weight * turning
+    unmatched = 1 + tangent_weight
+    instrumentation.count('matching_candidates', len(pairs))
+
+    line_index = STRtree(lines)
+    allowed = np.ones(len(pairs), dtype=bool)
+    verified = np.zeros(len(pairs), dtype=bool)
+    solved = {}  # candidate ids of a group -> the ids chosen from them
+
+    def crossing(ids):
+        # Which of the candidates `ids` cross a line
+        connections = shapely.linestrings(np.stack([endpoints[pairs[ids, 0]], endpoints[pairs[ids, 1]]], axis=1))
+        crosses, _ = line_index.query(connections, predicate='crosses')
+        instrumentation.count('connections_tested', len(ids))
+        verified[ids] = True
+        return ids[np.unique(crosses)]
+
+    while True:
+        candidates = np.flatnonzero(allowed)
+        graph = coo_matrix((np.ones(len(candidates)), (pairs[candidates, 0], pairs[candidates, 1])), shape=(n, n))
+        _, labels = connected_components(graph, directed=False)
+        large = np.bincount(labels)[labels[pairs[:, 0]]] > EXACT_MATCHING_SIZE
+        untested = np.flatnonzero(allowed & ~verified & large)
+        if len(untested):
+            allowed[crossing(untested)] = False
+            continue
+        candidates = candidates[np.argsort(labels[pairs[candidates, 0]], kind='stable')]
+        bounds = np.flatnonzero(np.diff(labels[pairs[candidates, 0]])) + 1
+        previous, solved = solved, {}
+        for group in np.split(candidates, bounds):
+            if len(group):
+                key = group.tobytes()
+                solved[key] = previous[key] if key in previous else \
+                    _match_group(pairs[group], costs[group], group, unmatched)
+        chosen = np.array([pair for pairs_chosen in solved.values() for pair in pairs_chosen], dtype=np.int64)
+        chosen = np.sort(chosen)
+        blocked = crossing(chosen[~verified[chosen]])
+        if not len(blocked):
+            return pairs[chosen, 0], pairs[chosen, 1]
+        allowed[blocked] = False
+
+def _match_group(pairs, costs, ids, unmatched):
+    # Ids of the pairs chosen within one connected group of candidates
+    nodes = np.unique(pairs)
+    if len(nodes) > EXACT_MATCHING_SIZE:
+        return _solve_matching(pairs, costs, ids, unmatched)
+    # The cheapest way to pair up or leave open every endpoint in a
+    # subset, memoised over bitmasks and always settling the lowest endpoint first
+    local = np.searchsorted(nodes, pairs).tolist()
+    neighbours = [[] for _ in nodes]
+    for (a, b), cost, pair in zip(local, costs.tolist(), ids.tolist()):
+        neighbours[a].append((b, cost, pair))
+        neighbours[b].append((a, cost, pair))
+    best = {0: (0.0, ())}
+
+    def solve(mask):
+        if mask not in best:
+            i = (mask & -mask).bit_length() - 1
+            rest = mask & ~(1 << i)
+            cost, chosen = solve(rest)
+            result = (cost + unmatched, chosen)
+            for j, pair_cost, pair in neighbours[i]:
+                if rest >> j & 1:
+                    cost, chosen = solve(rest & ~(1 << j))
+                    if cost + pair_cost < result[0]:
+                        result = (cost + pair_cost, chosen + (pair,))
+            best[mask] = result
+        return best[mask]
+    return list(solve((1 << len(nodes)) - 1)[1])
+
+def _solve_matching(pairs, costs, ids, unmatched, time_limit=MATCHING_TIME_LIMIT):
+    # _match_group as a 0/1 program, for groups too large to enumerate: one
+    # variable per candidate, at most one chosen candidate per endpoint, and
+    # every chosen one saving the cost of leaving its two endpoints open
+    nodes, local = np.unique(pairs, return_inverse=True)
+    incidence = csr_matrix((np.ones(2 * len(pairs)), (local.ravel(), np.repeat(np.arange(len(pairs)), 2))),
+                           shape=(len(nodes), len(pairs)))
+    result = milp(costs - 2 * unmatched, integrality=np.ones(len(pairs)), bounds=Bounds(0, 1),
+                  constraints=LinearConstraint(incidence, -np.inf, 1),
+                  options={'mip_rel_gap': 0, 'time_limit': time_limit})
+    instrumentation.count('matching_milp_groups')
+    if result.status != 0:
+        # Out of time: the best matching found so far, or a greedy one by cost
+        # when there is none yet
+        instrumentation.count('matching_inexact_groups')
+        if result.x is None:
+            used, chosen = set(), []
+            for k in np.argsort(costs, kind='stable'):
+                a, b = pairs[k]
+                if a not in used and b not in used:
+                    used.update((a, b))
+                    chosen.append(ids[k])
+            return chosen
+    return list(ids[result.x > 0.5])
+
+def merge_and_close(lines, max_distance=5):
     # Merge original lines and new connections
-    all_lines = lines + connections
-    merged = linemerge(all_lines)
+    merged = linemerge(lines)
     
     # Ensure merged is always a list of LineStrings
     if isinstance(merged, LineString):
@@ -58,27 +248,317 @@ def complete_curves(paths, max_distance=5):
     
     return final_curves
 
-svg_file_path = "data/problems/occlusion2_rec.svg"
-paths = svg_to_paths(svg_file_path)
-completed_curves = complete_curves(paths, max_distance=10)
+def _match_tile(owned, nearby, points, lines, max_distance):
+    # Nearest-endpoint candidates of the endpoints a tile owns. `nearby` holds
+    # every endpoint within max_distance of the tile and `lines` every line that
+    # reaches that far, so both the match and the crossing test see all they
+    # would in the whole drawing. `nearby` is sorted, so the lowest local index
+    # among equally near endpoints is also the lowest global one.
+    local = np.searchsorted(nearby, owned)
+    nearest, _ = nearest_endpoints(points, local, max_distance)
+    candidates = np.flatnonzero(nearest >= 0)
+    sources, targets = owned[candidates], nearby[nearest[candidates]]
+    if not len(candidates):
+        return sources, targets
+    connections = shapely.linestrings(np.stack([points[local[candidates]], points[nearest[candidates]]], axis=1))
+    crossing, _ = STRtree(lines).query(connections, predicate='crosses')
+    keep = np.ones(len(candidates), dtype=bool)
+    keep[crossing] = False
+    return sources[keep], targets[keep]
+
+def _match_tiles(jobs):
+    return [_match_tile(*job) for job in jobs]
+
+def _merge_components(components, max_distance):
+    return [merge_and_close(lines, max_distance) for lines in components]
+
+@instrumentation.timed('complete_curves.complete_lines_tiled')
+def complete_lines_tiled(lines, max_distance=5, tile_size=None, workers=None):
+    # complete_lines split over square tiles for drawings too large for one core.
+    # Each endpoint belongs to the tile it lies in, and the tile sees everything
+    # within max_distance of its border, so matching and crossing tests give the
+    # same connections as the whole-drawing run. Merging then happens per
+    # connected component (lines joined by connections) rather than in one
+    # linemerge. Tiles and components are spread over a process pool unless
+    # `workers` is 1; by default there are about four tiles per worker. The
+    # curves are the same as complete_lines gives, ordered by their lowest line.
+    workers = workers or os.cpu_count() or 1
+    if not lines:
+        return []
+    endpoints = np.array([(line.coords[0], line.coords[-1]) for line in lines]).reshape(-1, 2)
+    low, high = endpoints.min(axis=0), endpoints.max(axis=0)
+    if tile_size is None:
+        tile_size = (high - low).max() / np.ceil(np.sqrt(4 * workers))
+    tile_size = max(tile_size, max_distance, 1e-9)
+    tile = np.floor((endpoints - low) / tile_size).astype(np.int64)
+    tile_id = tile[:, 0] * (tile[:, 1].max() + 1) + tile[:, 1]
+    order = np.argsort(tile_id, kind='stable')
+    tile_ids, tile_starts = np.unique(tile_id[order], return_index=True)
+    boxes = [(low + tile[order[start]] * tile_size - max_distance,
+              low + (tile[order[start]] + 1) * tile_size + max_distance) for start in tile_starts]
+
+    # Endpoints and lines within reach of each tile
+    endpoint_index = STRtree(shapely.points(endpoints))
+    line_index = STRtree(lines)
+    halo = shapely.box(*np.array([np.concatenate(box) for box in boxes]).T)
+    near_tile, near_endpoint = endpoint_index.query(halo)
+    line_tile, near_line = line_index.query(halo)
+    near_endpoints = np.split(near_endpoint[np.lexsort((near_endpoint, near_tile))],
+                              np.searchsorted(np.sort(near_tile), np.arange(1, len(boxes))))
+    near_lines = np.split(near_line[np.lexsort((near_line, line_tile))],
+                          np.searchsorted(np.sort(line_tile), np.arange(1, len(boxes))))
+    owned = np.split(order, tile_starts[1:])
+    jobs = [(np.sort(mine), nearby, endpoints[nearby], [lines[i] for i in reach], max_distance)
+            for mine, nearby, reach in zip(owned, near_endpoints, near_lines)]
+    instrumentation.count('completion_tiles', len(jobs))
+
+    chunks = [jobs[i::workers] for i in range(min(workers, len(jobs)))]
+    if workers == 1 or len(jobs) == 1:
+        matched = [_match_tiles(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            matched = list(executor.map(_match_tiles, chunks))
+    pairs = [pair for chunk in matched for pair in chunk]
+    sources = np.concatenate([sources for sources, _ in pairs])
+    targets = np.concatenate([targets for _, targets in pairs])
+    order = np.argsort(sources, kind='stable')
+    sources, targets = sources[order], targets[order]
+    connections = shapely.linestrings(np.stack([endpoints[sources], endpoints[targets]], axis=1)) \
+        if len(sources) else np.empty(0, dtype=object)
+    instrumentation.count('connections_made', len(connections))
+
+    # Lines joined by a connection end up in the same merged curve
+    graph = coo_matrix((np.ones(len(sources)), (sources // 2, targets // 2)), shape=(len(lines), len(lines)))
+    _, labels = connected_components(graph, directed=False)
+    line_order = np.argsort(labels, kind='stable')
+    line_bounds = np.searchsorted(labels[line_order], np.arange(labels.max() + 2))
+    connection_labels = labels[sources // 2]
+    connection_order = np.argsort(connection_labels, kind='stable')
+    connection_bounds = np.searchsorted(connection_labels[connection_order], np.arange(labels.max() + 2))
+    components = [[lines[i] for i in line_order[a:b]] + list(connections[connection_order[c:d]])
+                  for a, b, c, d in zip(line_bounds[:-1], line_bounds[1:],
+                                        connection_bounds[:-1], connection_bounds[1:])]
+
+    chunks = [components[i::workers] for i in range(min(workers, len(components)))]
+    if workers == 1 or len(components) == 1:
+        merged = [_merge_components(chunk, max_distance) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            merged = list(executor.map(_merge_components, chunks, [max_distance] * len(chunks)))
+    # Undo the round-robin chunking so components come back in label order
+    curves = [None] * len(components)
+    for i, chunk in enumerate(merged):
+        curves[i::workers] = chunk
+    return [curve for component in curves for curve in component]
+
+class IncrementalCompleter:
+    # complete_lines for strokes that arrive one at a time. Endpoints, stroke
+    # segments and candidate connections are kept in a uniform grid of
+    # max_distance cells, so adding a stroke only looks at the cells around it:
+    # its own endpoints get their nearest neighbour, nearby endpoints switch to
+    # it when it is closer, connections it crosses are dropped, and only the
+    # connected components touched by those changes are merged again. Gives the
+    # same curves as complete_lines over all strokes so far (up to ordering),
+    # ties included: an older endpoint only switches to a strictly closer new
+    # one, which is what breaking ties by lowest index asks for.
+    def __init__(self, max_distance=5):
+        self.max_distance = max_distance
+        self.cell_size = max_distance if max_distance > 0 else 1.0
+        self.lines = []
+        self.endpoints = []  # (x, y) of endpoint 2 * line + end
+        self.target = []  # nearest other endpoint, or -1 when none is within max_distance
+        self.distance = []
+        self.blocked = []  # the connection to `target` crosses a stroke
+        self.endpoint_grid = {}
+        self.segment_grid = {}  # cell -> lines with a segment whose bounds touch it
+        self.connection_grid = {}  # cell -> endpoints whose connection bounds touch it
+        self.connections = {}  # endpoint -> its connection LineString
+        self.incoming = {}  # endpoint -> endpoints whose target it is
+        self.component = []  # component id per line
+        self.members = {}  # component id -> lines
+        self.merged = {}  # component id -> completed curves
+        self.next_component = 0
+
+    def _cell(self, x, y):
+        return int(np.floor(x / self.cell_size)), int(np.floor(y / self.cell_size))
+
+    def _cells(self, min_x, min_y, max_x, max_y):
+        (i0, j0), (i1, j1) = self._cell(min_x, min_y), self._cell(max_x, max_y)
+        return [(i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+
+    def _nearby_endpoints(self, x, y):
+        i, j = self._cell(x, y)
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                yield from self.endpoint_grid.get((i + di, j + dj), ())
+
+    def _crosses_any(self, connection):
+        lines = set()
+        for cell in self._cells(*connection.bounds):
+            lines.update(self.segment_grid.get(cell, ()))
+        if not lines:
+            return False
+        return bool(shapely.crosses(connection, [self.lines[line] for line in lines]).any())
+
+    def _set_target(self, e, f, distance):
+        # Points endpoint e at f (or nowhere when f is -1) and re-tests the connection
+        old = self.connections.pop(e, None)
+        if old is not None:
+            for cell in self._cells(*old.bounds):
+                self.connection_grid[cell].discard(e)
+            self.incoming[self.target[e]].discard(e)
+        self.target[e], self.distance[e], self.blocked[e] = f, distance, False
+        if f >= 0:
+            connection = LineString([self.endpoints[e], self.endpoints[f]])
+            self.connections[e] = connection
+            self.incoming.setdefault(f, set()).add(e)
+            for cell in self._cells(*connection.bounds):
+                self.connection_grid.setdefault(cell, set()).add(e)
+            self.blocked[e] = self._crosses_any(connection)
+            instrumentation.count('connections_tested')
+
+    @instrumentation.timed('complete_curves.IncrementalCompleter.add_stroke')
+    def add_stroke(self, stroke):
+        # Takes a LineString or (N, 2) points; returns the curves of every
+        # component the stroke changed
+        line = stroke if isinstance(stroke, LineString) else LineString(np.asarray(stroke, dtype=np.float64))
+        n = len(self.lines)
+        self.lines.append(line)
+        self.component.append(-1)
+        coords = np.asarray(line.coords)
+        for (x0, y0), (x1, y1) in zip(coords[:-1], coords[1:]):
+            for cell in self._cells(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)):
+                self.segment_grid.setdefault(cell, set()).add(n)
+        affected = {n}
+
+        # Connections the new stroke cuts through are blocked from now on
+        nearby = set()
+        for (x0, y0), (x1, y1) in zip(coords[:-1], coords[1:]):
+            for cell in self._cells(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)):
+                nearby.update(self.connection_grid.get(cell, ()))
+        nearby = [e for e in nearby if not self.blocked[e]]
+        if nearby:
+            crossed = shapely.crosses([self.connections[e] for e in nearby], line)
+            for e, crosses in zip(nearby, crossed):
+                if crosses:
+                    self.blocked[e] = True
+                    affected.update((e // 2, self.target[e] // 2))
+
+        new_endpoints = (2 * n, 2 * n + 1)
+        for e, point in zip(new_endpoints, (coords[0], coords[-1])):
+            self.endpoints.append((point[0], point[1]))
+            self.target.append(-1)
+            self.distance.append(np.inf)
+            self.blocked.append(False)
+            self.endpoint_grid.setdefault(self._cell(*point), []).append(e)
+
+        for e in new_endpoints:
+            x, y = self.endpoints[e]
+            best, best_distance = -1, np.inf
+            for f in self._nearby_endpoints(x, y):
+                if f == e:
+                    continue
+                # Summed and rooted as the KD-tree does, so ties and the cutoff
+                # come out exactly as in complete_lines
+                dx, dy = self.endpoints[f][0] - x, self.endpoints[f][1] - y
+                distance = np.sqrt(dx * dx + dy * dy)
+                # Equally near endpoints go to the lowest index, as in nearest_endpoints
+                if distance < best_distance or (distance == best_distance and f < best):
+                    best, best_distance = f, distance
+                # Older endpoints within reach switch to the new one when it is closer
+                if f < 2 * n and distance <= self.max_distance and distance < self.distance[f]:
+                    if self.target[f] >= 0:
+                        affected.add(self.target[f] // 2)
+                    self._set_target(f, e, distance)
+                    affected.add(f // 2)
+            if best_distance <= self.max_distance:
+                self._set_target(e, best, best_distance)
+                affected.add(best // 2)
+            else:
+                self.distance[e] = best_distance
+        return self._remerge(affected)
+
+    def _neighbours(self, line):
+        # Lines joined to `line` by a connection that is not blocked
+        for e in (2 * line, 2 * line + 1):
+            if self.target[e] >= 0 and not self.blocked[e]:
+                yield self.target[e] // 2
+            for source in self.incoming.get(e, ()):
+                if not self.blocked[source]:
+                    yield source // 2
+
+    def _remerge(self, affected):
+        # Components holding an affected line are rebuilt from scratch, since a
+        # blocked or retargeted connection may have split one apart
+        lines = set(affected)
+        for component in {self.component[line] for line in affected} - {-1}:
+            lines.update(self.members.pop(component))
+            del self.merged[component]
+        changed = []
+        for line in sorted(lines):
+            if self.component[line] in self.members:
+                continue
+            component = self.next_component
+            self.next_component += 1
+            members = [line]
+            self.component[line] = component
+            for member in members:
+                for neighbour in self._neighbours(member):
+                    if self.component[neighbour] != component:
+                        self.component[neighbour] = component
+                        members.append(neighbour)
+            members.sort()
+            connections = [self.connections[e] for member in members for e in (2 * member, 2 * member + 1)
+                           if self.target[e] >= 0 and not self.blocked[e]]
+            self.members[component] = members
+            self.merged[component] = merge_and_close([self.lines[member] for member in members] + connections,
+                                                     self.max_distance)
+            changed.extend(self.merged[component])
+        instrumentation.count('incremental_lines_remerged', len(lines))
+        return changed
+
+    def curves(self):
+        return [curve for component in sorted(self.merged) for curve in self.merged[component]]
+
+    def __len__(self):
+        return len(self.lines)
+
+def plot_completed_curves(original_lines, completed_curves, output_file, show=True):
+    fig = plt.figure(figsize=(10, 10))
+
+    # Plot original curves
+    for line in original_lines:
+        x, y = line.xy
+        plt.plot(x, y, color='blue', linewidth=1, alpha=0.5)
+
+    # Plot completed curves
+    for curve in completed_curves:
+        x, y = curve.xy
+        plt.plot(x, y, color='red', linewidth=2)
 
-plt.figure(figsize=(10, 10))
+    plt.axis('equal')
+    plt.title("Completed Curves")
+    plt.savefig(output_file)
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
 
-# Plot original curves
-for path in paths:
-    line = path_to_line(path)
-    x, y = line.xy
-    plt.plot(x, y, color='blue', linewidth=1, alpha=0.5)
+def save_curves_to_svg(curves, svg_path, precision=3, relative=True):
+    # One path per curve; closed curves end in "z"
+    bounds = np.array([curve.bounds for curve in curves]).reshape(-1, 4)
+    width, height = (np.ceil(bounds[:, 2:].max(axis=0)).astype(int) + 1) if len(bounds) else (1, 1)
+    with SVGWriter(svg_path, width, height, precision, relative) as svg:
+        for curve in curves:
+            svg.write_polylines([np.asarray(curve.coords)], closed=curve.is_ring)
 
-# Plot completed curves
-for curve in completed_curves:
-    x, y = curve.xy
-    plt.plot(x, y, color='red', linewidth=2)
+if __name__ == "__main__":
+    svg_file_path = "data/problems/occlusion2_rec.svg"
+    paths = svg_to_paths(svg_file_path)
+    completed_curves = complete_curves(paths, max_distance=10)
 
-plt.axis('equal')
-plt.title("Completed Curves")
-plt.savefig("completed_curves.png")
-plt.show()
+    plot_completed_curves([path_to_line(path) for path in paths], completed_curves, "completed_curves.png")
+    save_curves_to_svg(completed_curves, "completed_curves.svg")
 
-print(f"Number of original paths: {len(paths)}")
-print(f"Number of completed curves: {len(completed_curves)}")
\ No newline at end of file
+    print(f"Number of original paths: {len(paths)}")
+    print(f"Number of completed curves: {len(completed_curves)}")
@@ -1,9 +1,27 @@
+import atexit
+import cProfile
+import json
 import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+# Returned by span() while instrumentation is off, so a disabled span costs one
+# attribute check and an empty with-block
+_DISABLED_SPAN = nullcontext()
 
 
 class DSLogger(logging.Logger):
-    def __init__(self, name):
+    def __init__(self, name, enabled=False, profile=False, trace_memory=False):
         super().__init__(name)
+        self._lock = threading.Lock()
+        self.configure(enabled, profile, trace_memory)
+        self.reset()
 
     def print_red(self, message):
         print(f"\033[91m{message}\033[0m")
@@ -16,3 +34,151 @@ class DSLogger(logging.Logger):
 
     def print_bhagwa(self, message):
         print(f"\033[38;2;255;153;51m{message}\033[0m")
+
+    def configure(self, enabled=True, profile=False, trace_memory=False):
+        # `profile` runs cProfile and `trace_memory` records the tracemalloc peak
+        # inside spans; both only apply to the outermost span being captured
+        self.enabled = enabled
+        self.profile = enabled and profile
+        self.trace_memory = enabled and trace_memory
+
+    def reset(self):
+        with self._lock:
+            self.spans = {}  # name -> [count, total seconds, max seconds]
+            self.counters = defaultdict(int)
+            self.profiles = {}  # name -> pstats.Stats accumulated over calls
+            self.memory = {}  # name -> largest peak in bytes above the span's start
+            self._profiling = False
+            self._tracing = False
+
+    def span(self, name):
+        if not self.enabled:
+            return _DISABLED_SPAN
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name):
+        profiler = None
+        tracing = started_tracing = False
+        with self._lock:
+            if self.profile and not self._profiling:
+                self._profiling = True
+                profiler = cProfile.Profile()
+            if self.trace_memory and not self._tracing:
+                self._tracing = tracing = True
+        if tracing:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        if profiler:
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiler:
+                profiler.disable()
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1] - baseline
+                if started_tracing:
+                    tracemalloc.stop()
+            with self._lock:
+                record = self.spans.setdefault(name, [0, 0.0, 0.0])
+                record[0] += 1
+                record[1] += elapsed
+                record[2] = max(record[2], elapsed)
+                if profiler:
+                    self._profiling = False
+                    if name in self.profiles:
+                        self.profiles[name].add(profiler)
+                    else:
+                        self.profiles[name] = pstats.Stats(profiler)
+                if tracing:
+                    self._tracing = False
+                    self.memory[name] = max(self.memory.get(name, 0), peak)
+
+    def timed(self, name=None):
+        # Decorator form of span(); the span is named after the function by default
+        def decorator(function):
+            span_name = name or f'{function.__module__}.{function.__qualname__}'
+
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self._span(span_name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += int(n)
+
+    def summary(self, top=20):
+        with self._lock:
+            spans = {}
+            for name, (count, total, longest) in self.spans.items():
+                spans[name] = {'count': count, 'total_s': total, 'mean_s': total / count, 'max_s': longest}
+                if name in self.memory:
+                    spans[name]['peak_memory_bytes'] = self.memory[name]
+            profiles = {}
+            for name, stats in self.profiles.items():
+                # Functions with the largest cumulative time inside the span
+                rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+                profiles[name] = [{'function': f'{file}:{line}({function})', 'calls': calls,
+                                   'total_s': total, 'cumulative_s': cumulative}
+                                  for (file, line, function), (_, calls, total, cumulative, _) in rows]
+            return {'spans': spans, 'counters': dict(self.counters), 'profiles': profiles}
+
+    def merge(self, summary):
+        # Folds in a summary() taken elsewhere, e.g. in a worker process
+        with self._lock:
+            for name, span in summary['spans'].items():
+                record = self.spans.setdefault(name, [0, 0.0, 0.0])
+                record[0] += span['count']
+                record[1] += span['total_s']
+                record[2] = max(record[2], span['max_s'])
+                if 'peak_memory_bytes' in span:
+                    self.memory[name] = max(self.memory.get(name, 0), span['peak_memory_bytes'])
+            for name, value in summary['counters'].items():
+                self.counters[name] += value
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def report(self):
+        summary = self.summary()
+        self.print_blue(f"{'span':<48}{'count':>8}{'total s':>10}{'mean ms':>10}{'max ms':>10}")
+        for name, span in sorted(summary['spans'].items(), key=lambda item: -item[1]['total_s']):
+            print(f"{name:<48}{span['count']:>8}{span['total_s']:>10.3f}"
+                  f"{span['mean_s'] * 1000:>10.2f}{span['max_s'] * 1000:>10.2f}")
+        if summary['counters']:
+            self.print_blue(f"{'counter':<48}{'value':>8}")
+            for name, value in sorted(summary['counters'].items()):
+                print(f"{name:<48}{value:>8}")
+
+
+def configure_from_env(logger, environ=os.environ):
+    # CURVETOPIA_INSTRUMENT=1 turns spans and counters on; adding "profile" and/or
+    # "memory" (e.g. CURVETOPIA_INSTRUMENT=profile,memory) also captures cProfile
+    # stats and tracemalloc peaks. CURVETOPIA_INSTRUMENT_OUTPUT dumps the summary
+    # to that JSON file when the process exits.
+    flags = {flag.strip() for flag in environ.get('CURVETOPIA_INSTRUMENT', '').split(',') if flag.strip()}
+    if flags - {'0'}:
+        logger.configure(True, 'profile' in flags, 'memory' in flags)
+        output = environ.get('CURVETOPIA_INSTRUMENT_OUTPUT')
+        if output:
+            atexit.register(logger.dump, output)
+    return logger
+
+
+# Shared by every pipeline stage; disabled unless configured. Its log records
+# propagate to the root logger, so logging.basicConfig(level=logging.DEBUG) shows them.
+instrumentation = configure_from_env(DSLogger('curvetopia'))
+instrumentation.parent = logging.getLogger()
@@ -1,80 +1,71 @@
 import numpy as np
-from svgpathtools import svg2paths, Line, CubicBezier, Path
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from segment_array import SegmentArray, LINE, CUBIC, concatenate
+from sampling import sample_segments
+from svg_writer import SVGWriter
+from svg_stream import iter_svg_paths
+from custom_logger import instrumentation
 
+@instrumentation.timed('regularize.svg_to_segments')
 def svg_to_segments(svg_path):
-    paths, _ = svg2paths(svg_path)
-    segments = []
-    for path in paths:
-        for segment in path:
-            if isinstance(segment, (Line, CubicBezier)):
-                segments.append(segment)
+    # Only lines and cubics; quadratics and arcs are left out
+    segments = concatenate(path[np.flatnonzero((path.kinds == LINE) | (path.kinds == CUBIC))]
+                           for path in iter_svg_paths(svg_path))
+    instrumentation.count('segments_parsed', len(segments))
     print(f"Total segments extracted: {len(segments)}")
     return segments
 
-def is_outer_square(segment, all_segments):
-    start, end = segment.start, segment.end
-    max_distance = max(abs(start.real), abs(start.imag), abs(end.real), abs(end.imag))
-    return max_distance > 0.9 * max(max(abs(s.start.real), abs(s.start.imag), abs(s.end.real), abs(s.end.imag)) for s in all_segments)
+def is_outer_square(segments):
+    # Largest absolute endpoint coordinate of every segment, compared in a single pass
+    extents = np.abs(np.concatenate([segments.start, segments.end], axis=1)).max(axis=1)
+    if len(extents) == 0:
+        return np.zeros(0, dtype=bool)
+    return extents > 0.9 * extents.max()
 
 def create_perfect_square(segments):
-    points = np.array([(s.start.real, s.start.imag) for s in segments] +
-                      [(s.end.real, s.end.imag) for s in segments])
+    points = np.concatenate([segments.start, segments.end])
     min_x, min_y = np.min(points, axis=0)
     max_x, max_y = np.max(points, axis=0)
     side = max(max_x - min_x, max_y - min_y)
     center_x, center_y = (min_x + max_x) / 2, (min_y + max_y) / 2
     half_side = side / 2
-    square_points = [
-        complex(center_x - half_side, center_y - half_side),
-        complex(center_x + half_side, center_y - half_side),
-        complex(center_x + half_side, center_y + half_side),
-        complex(center_x - half_side, center_y + half_side)
-    ]
-    return [Line(square_points[i], square_points[(i+1)%4]) for i in range(4)]
+    square_points = np.array([
+        (center_x - half_side, center_y - half_side),
+        (center_x + half_side, center_y - half_side),
+        (center_x + half_side, center_y + half_side),
+        (center_x - half_side, center_y + half_side)
+    ])
+    return SegmentArray.lines(square_points, np.roll(square_points, -1, axis=0))
 
+@instrumentation.timed('regularize.regularize_segments')
 def regularize_segments(segments):
-    outer_segments = [s for s in segments if is_outer_square(s, segments)]
-    inner_segments = [s for s in segments if s not in outer_segments]
+    outer_mask = is_outer_square(segments)
+    outer_segments = segments[outer_mask]
+    inner_segments = segments[~outer_mask]
     
     print(f"Outer segments: {len(outer_segments)}")
     print(f"Inner segments: {len(inner_segments)}")
+    instrumentation.count('outer_segments_regularized', len(outer_segments))
     
     regularized_segments = create_perfect_square(outer_segments)
-    regularized_segments.extend(inner_segments)
-    
-    return regularized_segments
+    return concatenate([regularized_segments, inner_segments])
 
 def plot_segments(segments):
     fig, ax = plt.subplots(figsize=(6, 6))
-    for segment in segments:
-        if isinstance(segment, Line):
-            points = np.array([segment.start, segment.end])
-        elif isinstance(segment, CubicBezier):
-            t = np.linspace(0, 1, 100)
-            points = np.array([segment.point(ti) for ti in t])
-        ax.plot(points.real, points.imag, 'k-', linewidth=2)
+    is_line = segments.kinds == LINE
+    lines = list(segments.points[is_line][:, [0, 3]])
+    lines.extend(sample_segments(segments[~is_line], np.linspace(0, 1, 100)))
+    ax.add_collection(LineCollection(lines, colors='k', linewidths=2))
+    ax.autoscale_view()
     ax.set_aspect('equal')
     ax.axis('off')
     plt.tight_layout()
     plt.show()
 
-def save_segments_to_svg(segments, svg_path, size):
-    import svgwrite
-    dwg = svgwrite.Drawing(svg_path, size=(size, size))
-    for segment in segments:
-        if isinstance(segment, Line):
-            dwg.add(dwg.line(start=(segment.start.real, segment.start.imag),
-                             end=(segment.end.real, segment.end.imag),
-                             stroke='black', stroke_width=2))
-        elif isinstance(segment, CubicBezier):
-            path = dwg.path(d=f'M {segment.start.real},{segment.start.imag} '
-                            f'C {segment.control1.real},{segment.control1.imag} '
-                            f'{segment.control2.real},{segment.control2.imag} '
-                            f'{segment.end.real},{segment.end.imag}',
-                            stroke='black', fill='none', stroke_width=2)
-            dwg.add(path)
-    dwg.save()
+def save_segments_to_svg(segments, svg_path, size, precision=3, relative=True):
+    with SVGWriter(svg_path, size, size, precision, relative) as svg:
+        svg.write_segments(segments)
 
 if __name__ == "__main__":
     input_svg = "data/problems/frag0.svg" # add your path to the input file
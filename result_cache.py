@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+import numpy as np
+
+from custom_logger import instrumentation
+
+# Bumped whenever the layout of stored results changes, which orphans old entries
+CACHE_VERSION = 3
+# Share of max_bytes one cache may write before it scans the directory again,
+# since entries written by other processes only show up in a scan
+RESCAN_FRACTION = 1 / 16
+
+_digests = {}
+
+
+def file_digest(path):
+    # SHA-256 of the file contents, remembered per (path, size, mtime) so an
+    # unchanged file is only read once per process
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _digests.get(memo_key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        digest = _digests[memo_key] = sha.hexdigest()
+    return digest
+
+
+def result_key(input_key, stage, params=None):
+    # Content address of a stage result: the input (a file digest or the key of
+    # the upstream result), the stage name and its parameters
+    description = json.dumps({'version': CACHE_VERSION, 'input': input_key, 'stage': stage,
+                              'params': params or {}}, sort_keys=True, default=str)
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+class ResultCache:
+    # Results are dicts of NumPy arrays, stored uncompressed as one .npz per key.
+    # Reads go through an in-process LRU memo first; on disk, a hit refreshes the
+    # file's mtime and the oldest files are evicted once the cache grows past
+    # max_bytes. The size is tracked from this instance's own writes between
+    # directory scans, so with several processes sharing the directory it may
+    # run over by about RESCAN_FRACTION of max_bytes per process. Returned
+    # arrays are shared with the memo and must not be modified.
+    def __init__(self, cache_dir='.result_cache', max_bytes=1 << 30, memo_size=256):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.memo_size = memo_size
+        self.memo = OrderedDict()
+        self.lock = threading.Lock()
+        self._size = None  # bytes on disk at the last scan plus own writes since
+        self._unscanned = 0  # own bytes written since the last scan
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f'{key}.npz')
+
+    def _remember(self, key, arrays):
+        with self.lock:
+            self.memo[key] = arrays
+            self.memo.move_to_end(key)
+            while len(self.memo) > self.memo_size:
+                self.memo.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            arrays = self.memo.get(key)
+            if arrays is not None:
+                self.memo.move_to_end(key)
+                instrumentation.count('result_cache_memo_hits')
+                return arrays
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as archive:
+                arrays = {name: archive[name] for name in archive.files}
+            os.utime(path)
+        except (FileNotFoundError, ValueError, OSError):
+            # Missing, evicted by another process meanwhile, or truncated
+            instrumentation.count('result_cache_misses')
+            return None
+        instrumentation.count('result_cache_disk_hits')
+        self._remember(key, arrays)
+        return arrays
+
+    def put(self, key, arrays):
+        arrays = {name: np.asarray(value) for name, value in arrays.items()}
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a unique name and renamed, so concurrent writers and
+        # readers never see a partial file
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        # An entry being overwritten no longer counts once it is replaced
+        try:
+            replaced_size = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced_size = 0
+        os.replace(tmp_path, path)
+        self._remember(key, arrays)
+        written = os.path.getsize(path) - replaced_size
+        with self.lock:
+            if self._size is not None:
+                self._size += written
+                self._unscanned += written
+            scan = self._size is None or self._unscanned > self.max_bytes * RESCAN_FRACTION
+        if scan:
+            self._scanned(sum(size for _, size, _ in self._entries()))
+        with self.lock:
+            full = self._size > self.max_bytes
+        if full:
+            # Eviction scans again, so it only removes what the whole directory
+            # holds past max_bytes
+            self.evict()
+
+    def _scanned(self, total):
+        with self.lock:
+            self._size = total
+            self._unscanned = 0
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for filename in files:
+                if filename.endswith('.npz'):
+                    path = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((path, stat.st_size, stat.st_mtime_ns))
+        return entries
+
+    def evict(self, max_bytes=None):
+        # Least recently used entries go first until the cache fits again
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            instrumentation.count('result_cache_evictions')
+        self._scanned(total)
+
+    def clear(self):
+        with self.lock:
+            self.memo.clear()
+        self.evict(0)
+
+    def cached(self, key, compute, encode, decode):
+        # decode(get(key)) on a hit; otherwise computes, stores encode(result)
+        # and returns the freshly computed result
+        arrays = self.get(key)
+        if arrays is not None:
+            return decode(arrays)
+        result = compute()
+        self.put(key, encode(result))
+        return result
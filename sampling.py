@@ -0,0 +1,126 @@
+import numpy as np
+from svgpathtools import Arc
+from segment_array import SegmentArray
+
+# Gauss-Legendre nodes on [0, 1] used for vectorized arc-length integration
+_GL_NODES, _GL_WEIGHTS = np.polynomial.legendre.leggauss(24)
+_GL_NODES = (_GL_NODES + 1) / 2
+_GL_WEIGHTS = _GL_WEIGHTS / 2
+
+
+def _geometry(segments):
+    # Returns cubic-form control points (n, 4, 2), a mask of arc segments and the
+    # arc parameters (n, 8): center x/y, rx, ry, cos/sin of rotation, and
+    # start angle / sweep in radians.
+    if isinstance(segments, SegmentArray):
+        return segments.points, np.zeros(len(segments), dtype=bool), np.zeros((len(segments), 8))
+
+    segments = list(segments)
+    is_arc = np.array([isinstance(s, Arc) for s in segments], dtype=bool)
+    ctrl = np.zeros((len(segments), 4, 2))
+    arcs = np.zeros((len(segments), 8))
+    if (~is_arc).any():
+        ctrl[~is_arc] = SegmentArray.from_segments(s for s in segments if not isinstance(s, Arc)).points
+    for i in np.flatnonzero(is_arc):
+        arc = segments[i]
+        arcs[i] = (arc.center.real, arc.center.imag, arc.radius.real, arc.radius.imag,
+                   arc.rot_matrix.real, arc.rot_matrix.imag,
+                   np.radians(arc.theta), np.radians(arc.delta))
+    return ctrl, is_arc, arcs
+
+
+def _bernstein(t):
+    s = 1 - t
+    return np.stack([s * s * s, 3 * s * s * t, 3 * s * t * t, t * t * t], axis=-1)
+
+
+def _evaluate(ctrl, is_arc, arcs, index, t):
+    # Point of segment index[k] at parameter t[k], for every k at once
+    points = np.empty((len(index), 2))
+    bezier = ~is_arc[index]
+    if bezier.any():
+        points[bezier] = np.einsum('kj,kjd->kd', _bernstein(t[bezier]), ctrl[index[bezier]])
+    if (~bezier).any():
+        cx, cy, rx, ry, cos_phi, sin_phi, theta, delta = arcs[index[~bezier]].T
+        angle = theta + t[~bezier] * delta
+        x, y = rx * np.cos(angle), ry * np.sin(angle)
+        points[~bezier, 0] = cx + cos_phi * x - sin_phi * y
+        points[~bezier, 1] = cy + sin_phi * x + cos_phi * y
+    return points
+
+
+def _lengths(ctrl, is_arc, arcs):
+    # Straight segments (zero second differences in cubic form) are measured by
+    # their chord; only curved ones are integrated
+    lengths = np.linalg.norm(ctrl[:, 3] - ctrl[:, 0], axis=1)
+    curved = ~is_arc & np.any(ctrl[:, :2] - 2 * ctrl[:, 1:3] + ctrl[:, 2:] != 0, axis=(1, 2))
+    t = _GL_NODES[None, :, None]
+    s = 1 - t
+    p0, p1, p2, p3 = (ctrl[curved, i, None, :] for i in range(4))
+    derivative = 3 * (s * s * (p1 - p0) + 2 * s * t * (p2 - p1) + t * t * (p3 - p2))
+    lengths[curved] = np.linalg.norm(derivative, axis=-1) @ _GL_WEIGHTS
+    if is_arc.any():
+        _, _, rx, ry, _, _, theta, delta = (column[:, None] for column in arcs[is_arc].T)
+        angle = theta + _GL_NODES[None, :] * delta
+        speed = np.abs(delta) * np.hypot(rx * np.sin(angle), ry * np.cos(angle))
+        lengths[is_arc] = speed @ _GL_WEIGHTS
+    return lengths
+
+
+def sample_segments(segments, t):
+    # Every segment evaluated at every parameter in t, shape (n, len(t), 2)
+    ctrl, is_arc, arcs = _geometry(segments)
+    t = np.asarray(t, dtype=np.float64)
+    index = np.repeat(np.arange(len(ctrl)), len(t))
+    return _evaluate(ctrl, is_arc, arcs, index, np.tile(t, len(ctrl))).reshape(len(ctrl), len(t), 2)
+
+
+def sample_path(path, num_points=100):
+    # Equivalent of [path.point(T) for T in np.linspace(0, 1, num_points)], where
+    # the path parameter is split between segments in proportion to their length
+    ctrl, is_arc, arcs = _geometry(path)
+    lengths = _lengths(ctrl, is_arc, arcs)
+    total = lengths.sum()
+    fractions = lengths / total if total > 0 else np.full(len(lengths), 1 / len(lengths))
+    bounds = np.concatenate(([0], np.cumsum(fractions)))
+    bounds[-1] = 1
+
+    T = np.linspace(0, 1, num_points)
+    index = np.minimum(np.searchsorted(bounds[1:], T, side='left'), len(ctrl) - 1)
+    span = fractions[index]
+    t = np.divide(T - bounds[index], span, out=np.zeros_like(T), where=span > 0)
+    return _evaluate(ctrl, is_arc, arcs, index, np.clip(t, 0, 1))
+
+
+def flatten_segments(segments, tolerance=0.1, max_points=1000):
+    # Adaptive flattening: each segment gets just enough uniform subdivisions to
+    # stay within `tolerance` of the true curve, so straight runs emit only their
+    # endpoints. Returns the points and per-segment offsets into them.
+    ctrl, is_arc, arcs = _geometry(segments)
+
+    # Wang's bound on the subdivisions needed for a cubic within the tolerance
+    second_difference = np.maximum(
+        np.linalg.norm(ctrl[:, 0] - 2 * ctrl[:, 1] + ctrl[:, 2], axis=1),
+        np.linalg.norm(ctrl[:, 1] - 2 * ctrl[:, 2] + ctrl[:, 3], axis=1))
+    subdivisions = np.ceil(np.sqrt(0.75 * second_difference / tolerance))
+    if is_arc.any():
+        radius = np.maximum(arcs[is_arc, 2], arcs[is_arc, 3])
+        step = 2 * np.arccos(np.clip(1 - tolerance / radius, -1, 1))
+        subdivisions[is_arc] = np.ceil(np.abs(arcs[is_arc, 7]) / np.maximum(step, 1e-9))
+    subdivisions = np.clip(subdivisions, 1, max_points - 1).astype(np.int64)
+
+    counts = subdivisions + 1
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    index = np.repeat(np.arange(len(ctrl)), counts)
+    step_index = np.arange(offsets[-1]) - np.repeat(offsets[:-1], counts)
+    t = step_index / np.repeat(subdivisions, counts)
+    return _evaluate(ctrl, is_arc, arcs, index, t), offsets
+
+
+def flatten_path(path, tolerance=0.1, max_points=1000):
+    # Single polyline for a path, dropping the repeated point where one segment
+    # starts exactly at the end of the previous one
+    points, offsets = flatten_segments(path, tolerance, max_points)
+    joins = offsets[1:-1]
+    duplicate = np.all(points[joins] == points[joins - 1], axis=1)
+    return np.delete(points, joins[duplicate], axis=0)
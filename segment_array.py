@@ -0,0 +1,103 @@
+import numpy as np
+from svgpathtools import Line, QuadraticBezier, CubicBezier
+
+# Type tag per segment. Every segment is stored in cubic form (start, control1,
+# control2, end); lines and quadratics are degree-elevated exactly, so the tag
+# only records how the segment should be written back out.
+LINE, QUADRATIC, CUBIC, ARC = 0, 1, 2, 3
+
+
+class SegmentArray:
+    def __init__(self, points, kinds):
+        self.points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 4, 2)
+        self.kinds = np.ascontiguousarray(kinds, dtype=np.int8).reshape(-1)
+        if len(self.points) != len(self.kinds):
+            raise ValueError("points and kinds must describe the same number of segments.")
+
+    @property
+    def start(self):
+        return self.points[:, 0]
+
+    @property
+    def control1(self):
+        return self.points[:, 1]
+
+    @property
+    def control2(self):
+        return self.points[:, 2]
+
+    @property
+    def end(self):
+        return self.points[:, 3]
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        if np.isscalar(index):
+            index = [index]
+        return SegmentArray(self.points[index], self.kinds[index])
+
+    def __repr__(self):
+        return f"SegmentArray({len(self)} segments)"
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty((0, 4, 2)), np.empty(0, dtype=np.int8))
+
+    @classmethod
+    def lines(cls, starts, ends):
+        starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+        ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+        delta = ends - starts
+        points = np.stack([starts, starts + delta / 3, starts + 2 * delta / 3, ends], axis=1)
+        return cls(points, np.full(len(starts), LINE, dtype=np.int8))
+
+    @classmethod
+    def from_segments(cls, segments):
+        segments = list(segments)
+        ctrl = np.zeros((len(segments), 4), dtype=complex)
+        kinds = np.empty(len(segments), dtype=np.int8)
+        for i, segment in enumerate(segments):
+            if isinstance(segment, CubicBezier):
+                kinds[i] = CUBIC
+                ctrl[i] = segment.bpoints()
+            elif isinstance(segment, Line):
+                kinds[i] = LINE
+                ctrl[i, 0], ctrl[i, 3] = segment.start, segment.end
+            elif isinstance(segment, QuadraticBezier):
+                kinds[i] = QUADRATIC
+                ctrl[i, :3] = segment.bpoints()
+            else:
+                raise TypeError(f"Unsupported segment type: {type(segment).__name__}")
+
+        # Degree elevation to cubic form
+        line = kinds == LINE
+        ctrl[line, 1] = ctrl[line, 0] + (ctrl[line, 3] - ctrl[line, 0]) / 3
+        ctrl[line, 2] = ctrl[line, 0] + 2 * (ctrl[line, 3] - ctrl[line, 0]) / 3
+        quad = kinds == QUADRATIC
+        q0, q1, q2 = ctrl[quad, 0], ctrl[quad, 1], ctrl[quad, 2]
+        ctrl[quad, 1] = q0 + 2 * (q1 - q0) / 3
+        ctrl[quad, 2] = q2 + 2 * (q1 - q2) / 3
+        ctrl[quad, 3] = q2
+        return cls(np.stack([ctrl.real, ctrl.imag], axis=-1), kinds)
+
+    def to_segments(self):
+        ctrl = self.points[..., 0] + 1j * self.points[..., 1]
+        segments = []
+        for kind, (p0, p1, p2, p3) in zip(self.kinds.tolist(), ctrl.tolist()):
+            if kind == LINE:
+                segments.append(Line(p0, p3))
+            elif kind == QUADRATIC:
+                segments.append(QuadraticBezier(p0, (3 * p1 - p0) / 2, p3))
+            else:
+                segments.append(CubicBezier(p0, p1, p2, p3))
+        return segments
+
+
+def concatenate(segment_arrays):
+    segment_arrays = list(segment_arrays)
+    if not segment_arrays:
+        return SegmentArray.empty()
+    return SegmentArray(np.concatenate([s.points for s in segment_arrays]),
+                        np.concatenate([s.kinds for s in segment_arrays]))
@@ -0,0 +1,205 @@
+import argparse
+import http.client
+import io
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import cv2
+
+# Add the root directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from data_preparation.data_preparation import SHAPE_CLASSES, read_curves, rasterize_polylines
+
+
+def load_classifier(model_path):
+    # Exported .npz weights run on the NumPy engine; anything else goes through Keras
+    if model_path.endswith('.npz'):
+        from numpy_inference import load_numpy_model
+        return load_numpy_model(model_path).predict
+    from model import load_trained_model
+    model = load_trained_model(model_path)
+    return lambda batch: model.predict(batch, verbose=0)
+
+
+class MicroBatcher:
+    # Coalesces concurrent requests into batches: a batch is run as soon as it
+    # holds `max_batch` images or its oldest request has waited `max_latency` seconds
+    def __init__(self, predict, max_batch=64, max_latency=0.005, img_size=64):
+        self.predict = predict
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.img_size = img_size
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.num_requests = 0
+        self.num_batches = 0
+        self.latencies = deque(maxlen=10_000)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, image):
+        future = Future()
+        self.requests.put((np.asarray(image, dtype=np.uint8).reshape(self.img_size, self.img_size, 1),
+                           future, time.perf_counter()))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            deadline = batch[0][2] + self.max_latency
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                probabilities = self.predict(np.stack([image for image, _, _ in batch]) / np.float32(255.0))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+            with self.lock:
+                self.num_requests += len(batch)
+                self.num_batches += 1
+                self.latencies.extend(finished - submitted for _, _, submitted in batch)
+            for (_, future, _), row in zip(batch, probabilities):
+                future.set_result(row)
+
+    def stats(self):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            elapsed = time.perf_counter() - self.started
+            return {
+                'requests': self.num_requests,
+                'batches': self.num_batches,
+                'mean_batch_size': self.num_requests / self.num_batches if self.num_batches else 0.0,
+                'latency_ms_p50': float(np.percentile(latencies, 50)) if len(latencies) else None,
+                'latency_ms_p99': float(np.percentile(latencies, 99)) if len(latencies) else None,
+                'throughput_per_s': self.num_requests / elapsed if elapsed > 0 else 0.0,
+            }
+
+
+def image_from_png(data, img_size=64):
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise ValueError("Could not decode the PNG image.")
+    return cv2.resize(img, (img_size, img_size))
+
+
+def image_from_csv(text, img_size=64):
+    curves = read_curves(io.StringIO(text))
+    if curves.num_segments == 0:
+        raise ValueError("No data found in CSV drawing.")
+    return rasterize_polylines(curves.points, curves.offsets, img_size=img_size, fit=True)[0]
+
+
+def make_handler(batcher):
+    class ClassifyHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self._reply(200, batcher.stats())
+            else:
+                self._reply(404, {'error': 'not found'})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if self.path != '/classify':
+                self._reply(404, {'error': 'not found'})
+                return
+            try:
+                if self.headers.get('Content-Type', '').startswith('text/csv'):
+                    image = image_from_csv(body.decode(), batcher.img_size)
+                else:
+                    image = image_from_png(body, batcher.img_size)
+                probabilities = batcher.submit(image).result()
+            except Exception as e:
+                self._reply(400, {'error': str(e)})
+                return
+            label = int(np.argmax(probabilities))
+            self._reply(200, {'label': label, 'class': SHAPE_CLASSES[label],
+                              'probabilities': [float(p) for p in probabilities]})
+
+        def log_message(self, format, *args):
+            pass
+
+    return ClassifyHandler
+
+
+def serve(model_path, host='127.0.0.1', port=8765, max_batch=64, max_latency=0.005):
+    batcher = MicroBatcher(load_classifier(model_path), max_batch, max_latency)
+    server = ThreadingHTTPServer((host, port), make_handler(batcher))
+    server.daemon_threads = True
+    return server, batcher
+
+
+class ClassifierClient:
+    # Keeps one HTTP/1.1 connection open; use one client per thread
+    def __init__(self, host='127.0.0.1', port=8765, timeout=30):
+        self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def _request(self, method, path, body=None, content_type=None):
+        headers = {'Content-Type': content_type} if content_type else {}
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        payload = json.loads(response.read())
+        if response.status != 200:
+            raise RuntimeError(payload.get('error', f'HTTP {response.status}'))
+        return payload
+
+    def classify_png(self, png):
+        if isinstance(png, str):
+            with open(png, 'rb') as f:
+                png = f.read()
+        return self._request('POST', '/classify', png, 'image/png')
+
+    def classify_image(self, image):
+        ok, png = cv2.imencode('.png', np.asarray(image, dtype=np.uint8))
+        if not ok:
+            raise ValueError("Could not encode the image.")
+        return self.classify_png(png.tobytes())
+
+    def classify_csv(self, csv_path):
+        with open(csv_path) as f:
+            return self._request('POST', '/classify', f.read().encode(), 'text/csv')
+
+    def stats(self):
+        return self._request('GET', '/stats')
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the shape classifier with micro-batching.")
+    parser.add_argument('--model', default='model.npz')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-latency-ms', type=float, default=5.0)
+    args = parser.parse_args()
+    server, _ = serve(args.model, args.host, args.port, args.max_batch, args.max_latency_ms / 1000)
+    print(f"Serving {args.model} on http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,151 @@
+import argparse
+import os
+import struct
+import numpy as np
+
+from .data_preparation import RaggedCurves, read_curves, instrumentation
+
+# File layout, all little-endian: a 64-byte header (magic, number of paths,
+# segments and points, flags) followed by 64-byte aligned sections holding
+# path_offsets (int64, paths + 1), segment offsets (int64, segments + 1),
+# points (float32, points x 2) and, with HAS_BOUNDS, per-path
+# (min x, min y, max x, max y) bounds (float32, paths x 4).
+MAGIC = b'CURVES01'
+HEADER = struct.Struct('<8sQQQQ')
+HEADER_SIZE = 64
+HAS_BOUNDS = 1
+
+
+def _align(position):
+    return (position + 63) // 64 * 64
+
+
+def _layout(num_paths, num_segments, num_points, flags):
+    # (name, dtype, shape, byte offset) of every section
+    sections = []
+    position = HEADER_SIZE
+    for name, dtype, shape in (('path_offsets', '<i8', (num_paths + 1,)),
+                               ('offsets', '<i8', (num_segments + 1,)),
+                               ('points', '<f4', (num_points, 2)),
+                               ('bounds', '<f4', (num_paths, 4))):
+        if name == 'bounds' and not flags & HAS_BOUNDS:
+            continue
+        sections.append((name, dtype, shape, position))
+        position = _align(position + int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    return sections
+
+
+def path_bounds(curves):
+    # (min x, min y, max x, max y) of every path; NaN for paths without points
+    bounds = np.full((curves.num_paths, 4), np.nan, dtype=np.float32)
+    starts = curves.offsets[curves.path_offsets]
+    nonempty = np.flatnonzero(np.diff(starts) > 0)
+    if len(nonempty):
+        bounds[nonempty, :2] = np.minimum.reduceat(curves.points, starts[:-1][nonempty])
+        bounds[nonempty, 2:] = np.maximum.reduceat(curves.points, starts[:-1][nonempty])
+    return bounds
+
+
+@instrumentation.timed('curve_store.write_curves')
+def write_curves(curves, path, bounds=True):
+    # Takes RaggedCurves or read_csv's nested path_XYs
+    if not isinstance(curves, RaggedCurves):
+        curves = RaggedCurves.from_nested(curves)
+    flags = HAS_BOUNDS if bounds else 0
+    arrays = {'path_offsets': curves.path_offsets, 'offsets': curves.offsets, 'points': curves.points}
+    if bounds:
+        arrays['bounds'] = path_bounds(curves)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, curves.num_paths, curves.num_segments, len(curves.points), flags)
+                .ljust(HEADER_SIZE, b'\0'))
+        for name, dtype, shape, position in _layout(curves.num_paths, curves.num_segments, len(curves.points), flags):
+            f.write(b'\0' * (position - f.tell()))
+            f.write(np.ascontiguousarray(arrays[name], dtype=dtype).reshape(shape).tobytes())
+    os.replace(tmp_path, path)
+
+
+def convert_csv(csv_path, path, bounds=True):
+    curves = read_curves(csv_path)
+    write_curves(curves, path, bounds)
+    return curves
+
+
+class CurveStore:
+    # Read-only view of a file written by write_curves. Every section is an
+    # np.memmap, so opening costs the same for any file size and only the pages
+    # of the paths actually touched are read. Paths come back in read_csv's
+    # layout (a list of (N, 2) float32 arrays) as views into the mapping. A store
+    # pickles as its file name, so worker processes map the same file instead of
+    # receiving a copy.
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, self.num_paths, self.num_segments, self.num_points, self.flags = \
+                HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a curve store")
+        self.bounds = None
+        for name, dtype, shape, position in _layout(self.num_paths, self.num_segments, self.num_points, self.flags):
+            # np.memmap cannot map zero bytes
+            array = np.memmap(path, dtype=dtype, mode='r', offset=position, shape=shape) \
+                if np.prod(shape) else np.empty(shape, dtype=dtype)
+            setattr(self, name, array)
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def __len__(self):
+        return self.num_paths
+
+    def segments(self, index):
+        # The polylines of one path
+        first, last = self.path_offsets[index], self.path_offsets[index + 1]
+        bounds = self.offsets[first:last + 1]
+        return [self.points[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.segments(i) for i in range(*index.indices(self.num_paths))]
+        if index < 0:
+            index += self.num_paths
+        if not 0 <= index < self.num_paths:
+            raise IndexError(index)
+        return self.segments(index)
+
+    def __iter__(self):
+        for index in range(self.num_paths):
+            yield self.segments(index)
+
+    def paths_within(self, min_x, min_y, max_x, max_y):
+        # Ids of the paths whose bounds intersect the box, without touching points
+        if self.bounds is None:
+            raise ValueError(f"{self.path} was written without bounds")
+        return np.flatnonzero((self.bounds[:, 0] <= max_x) & (self.bounds[:, 2] >= min_x) &
+                              (self.bounds[:, 1] <= max_y) & (self.bounds[:, 3] >= min_y))
+
+    def to_curves(self):
+        # The whole drawing as RaggedCurves, still backed by the mapping
+        return RaggedCurves(self.points, self.offsets, self.path_offsets)
+
+    def __repr__(self):
+        return f"CurveStore({self.path!r}: {self.num_paths} paths, {self.num_segments} segments, {self.num_points} points)"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert CSV drawings to the memory-mapped curve format.")
+    parser.add_argument('inputs', nargs='+', help="CSV files; each is written next to it as <name>.curves")
+    parser.add_argument('--out-dir', default=None)
+    parser.add_argument('--no-bounds', action='store_true', help="Leave out the per-path bounds")
+    args = parser.parse_args()
+
+    for csv_path in args.inputs:
+        out_dir = args.out_dir or os.path.dirname(csv_path)
+        os.makedirs(out_dir or '.', exist_ok=True)
+        path = os.path.join(out_dir, os.path.splitext(os.path.basename(csv_path))[0] + '.curves')
+        curves = convert_csv(csv_path, path, not args.no_bounds)
+        print(f"{csv_path} -> {path} ({curves.num_paths} paths, {len(curves.points)} points, "
+              f"{os.path.getsize(path) / 2 ** 20:.2f} MiB)")
@@ -1,92 +1,118 @@
 import os
+import logging
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import cv2
 import matplotlib.pyplot as plt
 
+try:
+    from custom_logger import instrumentation
+except ImportError:
+    # custom_logger lives at the repository root, which is not on the path when
+    # this file runs as a script or is imported from src/; nothing is recorded then
+    class _Uninstrumented(logging.Logger):
+        def span(self, name):
+            return nullcontext()
+
+        def timed(self, name=None):
+            return lambda function: function
+
+        def count(self, name, n=1):
+            pass
+
+    instrumentation = _Uninstrumented('curvetopia')
+
+SHAPE_CLASSES = ['ellipse', 'circle', 'rounded_rectangle', 'rectangle', 'square', 'triangle', 'star']
+
+def draw_shape(shape, img_size=64, rng=np.random):
+    # `rng` is anything with the legacy randint interface: the np.random module
+    # itself or a seeded np.random.RandomState
+    img = np.zeros((img_size, img_size), dtype=np.uint8)
+
+    # Initialize label to a default value
+    label = -1
+
+    if shape == 'ellipse':
+        # Generate ellipse
+        center = (rng.randint(10, 50), rng.randint(10, 50))
+        axes = (rng.randint(5, 25), rng.randint(5, 25))
+        angle = rng.randint(0, 360)
+        cv2.ellipse(img, center, axes, angle, 0, 360, 255, -1)  # Use white (255)
+        label = 0
+    
+    elif shape == 'circle':
+        # Generate circle
+        center = (rng.randint(10, 50), rng.randint(10, 50))
+        radius = rng.randint(5, 25)
+        cv2.circle(img, center, radius, 255, -1)  # Use white (255)
+        label = 1
+    
+    elif shape == 'rounded_rectangle':
+        # Generate rounded rectangle
+        pt1 = (rng.randint(5, 40), rng.randint(5, 40))
+        pt2 = (rng.randint(5, 55), rng.randint(5, 55))
+        radius = rng.randint(3, 10)
+        cv2.rectangle(img, pt1, pt2, 255, -1)  # Use white (255)
+        label = 2
+    
+    elif shape == 'rectangle':
+        # Generate rectangle
+        pt1 = (rng.randint(5, 40), rng.randint(5, 40))
+        pt2 = (rng.randint(5, 55), rng.randint(5, 55))
+        cv2.rectangle(img, pt1, pt2, 255, -1)  # Use white (255)
+        label = 3
+    
+    elif shape == 'square':
+        # Generate square
+        pt1 = (rng.randint(5, 40), rng.randint(5, 40))
+        side_length = rng.randint(10, 25)
+        pt2 = (pt1[0] + side_length, pt1[1] + side_length)
+        cv2.rectangle(img, pt1, pt2, 255, -1)  # Use white (255)
+        label = 4
+    
+    elif shape == 'triangle':
+        # Generate triangle
+        x1, y1 = rng.randint(5, 55), rng.randint(5, 55)
+        x2, y2 = rng.randint(5, 55), rng.randint(5, 55)
+        x3, y3 = rng.randint(5, 55), rng.randint(5, 55)
+        pts = np.array([[x1, y1], [x2, y2], [x3, y3]], np.int32)
+        pts = pts.reshape((-1, 1, 2))
+        cv2.fillPoly(img, [pts], 255)  # Use white (255)
+        label = 5
+    
+    elif shape == 'star':
+        # Generate star (5-pointed)
+        center = (32, 32)
+        radius = 20
+        pts = []
+        for k in range(5):
+            x = center[0] + int(radius * np.cos(k * 4 * np.pi / 5))
+            y = center[1] + int(radius * np.sin(k * 4 * np.pi / 5))
+            pts.append([x, y])
+        pts = np.array(pts, np.int32)
+        pts = pts.reshape((-1, 1, 2))
+        cv2.fillPoly(img, [pts], 255)  # Use white (255)
+        label = 6
+    
+    # Ensure label is set
+    if label == -1:
+        raise ValueError("Label was not assigned correctly.")
+    return img, label
+
 def generate_synthetic_data(num_samples, img_size=64, save_dir='synthetic_data'):
     # Create directories for each shape class
-    shape_classes = ['ellipse', 'circle', 'rounded_rectangle', 'rectangle', 'square', 'triangle', 'star']
     os.makedirs(save_dir, exist_ok=True)
-    for shape in shape_classes:
+    for shape in SHAPE_CLASSES:
         os.makedirs(os.path.join(save_dir, shape), exist_ok=True)
 
     data = []
     labels = []
 
     for i in range(num_samples):
-        img = np.zeros((img_size, img_size), dtype=np.uint8)
-
         # Generate a random shape
-        shape = np.random.choice(shape_classes)
-
-        # Initialize label to a default value
-        label = -1
-
-        if shape == 'ellipse':
-            # Generate ellipse
-            center = (np.random.randint(10, 50), np.random.randint(10, 50))
-            axes = (np.random.randint(5, 25), np.random.randint(5, 25))
-            angle = np.random.randint(0, 360)
-            cv2.ellipse(img, center, axes, angle, 0, 360, 255, -1)  # Use white (255)
-            label = 0
-        
-        elif shape == 'circle':
-            # Generate circle
-            center = (np.random.randint(10, 50), np.random.randint(10, 50))
-            radius = np.random.randint(5, 25)
-            cv2.circle(img, center, radius, 255, -1)  # Use white (255)
-            label = 1
-        
-        elif shape == 'rounded_rectangle':
-            # Generate rounded rectangle
-            pt1 = (np.random.randint(5, 40), np.random.randint(5, 40))
-            pt2 = (np.random.randint(5, 55), np.random.randint(5, 55))
-            radius = np.random.randint(3, 10)
-            cv2.rectangle(img, pt1, pt2, 255, -1)  # Use white (255)
-            label = 2
-        
-        elif shape == 'rectangle':
-            # Generate rectangle
-            pt1 = (np.random.randint(5, 40), np.random.randint(5, 40))
-            pt2 = (np.random.randint(5, 55), np.random.randint(5, 55))
-            cv2.rectangle(img, pt1, pt2, 255, -1)  # Use white (255)
-            label = 3
-        
-        elif shape == 'square':
-            # Generate square
-            pt1 = (np.random.randint(5, 40), np.random.randint(5, 40))
-            side_length = np.random.randint(10, 25)
-            pt2 = (pt1[0] + side_length, pt1[1] + side_length)
-            cv2.rectangle(img, pt1, pt2, 255, -1)  # Use white (255)
-            label = 4
-        
-        elif shape == 'triangle':
-            # Generate triangle
-            x1, y1 = np.random.randint(5, 55), np.random.randint(5, 55)
-            x2, y2 = np.random.randint(5, 55), np.random.randint(5, 55)
-            x3, y3 = np.random.randint(5, 55), np.random.randint(5, 55)
-            pts = np.array([[x1, y1], [x2, y2], [x3, y3]], np.int32)
-            pts = pts.reshape((-1, 1, 2))
-            cv2.fillPoly(img, [pts], 255)  # Use white (255)
-            label = 5
-        
-        elif shape == 'star':
-            # Generate star (5-pointed)
-            center = (32, 32)
-            radius = 20
-            pts = []
-            for i in range(5):
-                x = center[0] + int(radius * np.cos(i * 4 * np.pi / 5))
-                y = center[1] + int(radius * np.sin(i * 4 * np.pi / 5))
-                pts.append([x, y])
-            pts = np.array(pts, np.int32)
-            pts = pts.reshape((-1, 1, 2))
-            cv2.fillPoly(img, [pts], 255)  # Use white (255)
-            label = 6
-        
-        # Ensure label is set
-        if label == -1:
-            raise ValueError("Label was not assigned correctly.")
+        shape = np.random.choice(SHAPE_CLASSES)
+        img, label = draw_shape(shape, img_size)
 
         # Save the image to the corresponding folder
         cv2.imwrite(os.path.join(save_dir, shape, f'{i}.png'), img)
@@ -97,50 +123,197 @@ def generate_synthetic_data(num_samples, img_size=64, save_dir='synthetic_data')
     return np.array(data).reshape(-1, img_size, img_size, 1), np.array(labels)
 
 
-def read_csv(csv_path):
-    np_path_XYs = np.genfromtxt(csv_path, delimiter=',')
-    path_XYs = []
-    for i in np.unique(np_path_XYs[:, 0]):
-        npXYs = np_path_XYs[np_path_XYs[:, 0] == i][:, 1:]
-        XYs = []
-        for j in np.unique(npXYs[:, 0]):
-            XY = npXYs[npXYs[:, 0] == j][:, 1:]
-            XYs.append(XY)
-        path_XYs.append(XYs)
-    return path_XYs
+class RaggedCurves:
+    # A whole drawing in three arrays: every point in one contiguous (N, 2) buffer,
+    # `offsets` delimiting the segments (strokes) within it, and `path_offsets`
+    # delimiting the segments of each path. Stages work on the flat buffer with
+    # vectorized kernels instead of looping over nested lists of arrays.
+    def __init__(self, points, offsets, path_offsets=None, dtype=np.float32):
+        self.points = np.ascontiguousarray(points, dtype=dtype).reshape(-1, 2)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        if path_offsets is None:
+            path_offsets = [0, len(self.offsets) - 1]
+        self.path_offsets = np.asarray(path_offsets, dtype=np.int64)
+
+    @classmethod
+    def from_nested(cls, paths_XYs, dtype=np.float32):
+        points, offsets = flatten_polylines(paths_XYs)
+        path_offsets = np.cumsum([0] + [len(XYs) for XYs in paths_XYs])
+        return cls(points, offsets, path_offsets, dtype)
+
+    @classmethod
+    def from_lengths(cls, points, lengths, path_offsets=None, dtype=np.float32):
+        return cls(points, np.concatenate(([0], np.cumsum(lengths, dtype=np.int64))), path_offsets, dtype)
+
+    @property
+    def num_paths(self):
+        return len(self.path_offsets) - 1
+
+    @property
+    def num_segments(self):
+        return len(self.offsets) - 1
+
+    @property
+    def segment_lengths(self):
+        return np.diff(self.offsets)
+
+    def segment_ids(self):
+        # Segment of every point
+        return np.repeat(np.arange(self.num_segments), self.segment_lengths)
+
+    def path_ids(self):
+        # Path of every segment
+        return np.repeat(np.arange(self.num_paths), np.diff(self.path_offsets))
+
+    def to_nested(self):
+        # read_csv's list-of-lists layout; every segment is a view into `points`
+        segments = [self.points[start:stop] for start, stop in zip(self.offsets[:-1], self.offsets[1:])]
+        return [segments[start:stop] for start, stop in zip(self.path_offsets[:-1], self.path_offsets[1:])]
+
+    def __len__(self):
+        return self.num_paths
+
+    def __repr__(self):
+        return f"RaggedCurves({self.num_paths} paths, {self.num_segments} segments, {len(self.points)} points)"
+
+
+@instrumentation.timed('data_preparation.read_curves')
+def read_curves(csv_path, dtype=np.float32):
+    # .curves files (see curve_store) are memory-mapped rather than parsed
+    if isinstance(csv_path, (str, os.PathLike)) and os.fspath(csv_path).endswith('.curves'):
+        from .curve_store import CurveStore
+        curves = CurveStore(csv_path).to_curves()
+        return RaggedCurves(curves.points, curves.offsets, curves.path_offsets, dtype)
+    # One pass over the text; columns are path id, segment id, x, y
+    np_path_XYs = np.loadtxt(csv_path, delimiter=',', dtype=np.float64, ndmin=2)
+    if np_path_XYs.size == 0:
+        return RaggedCurves(np.empty((0, 2)), [0], [0], dtype)
+    path_ids = np_path_XYs[:, 0]
+    segment_ids = np_path_XYs[:, 1]
+
+    # Stable sort by (path id, segment id) keeps the file order inside each segment,
+    # and is skipped entirely for files that are already grouped
+    unsorted = (np.diff(path_ids) < 0) | ((np.diff(path_ids) == 0) & (np.diff(segment_ids) < 0))
+    if unsorted.any():
+        order = np.lexsort((segment_ids, path_ids))
+        path_ids = path_ids[order]
+        segment_ids = segment_ids[order]
+        points = np_path_XYs[order, 2:]
+    else:
+        points = np_path_XYs[:, 2:]
+    instrumentation.count('points_read', len(points))
+
+    new_segment = (path_ids[1:] != path_ids[:-1]) | (segment_ids[1:] != segment_ids[:-1])
+    segment_starts = np.concatenate(([0], np.flatnonzero(new_segment) + 1))
+    segment_path_ids = path_ids[segment_starts]
+    path_starts = np.flatnonzero(segment_path_ids[1:] != segment_path_ids[:-1]) + 1
+    offsets = np.concatenate((segment_starts, [len(points)]))
+    path_offsets = np.concatenate(([0], path_starts, [len(segment_starts)]))
+    return RaggedCurves(points, offsets, path_offsets, dtype)
+
+def read_csv(csv_path, dtype=np.float64):
+    # Nested form of read_curves: all segments are views into one contiguous buffer
+    return read_curves(csv_path, dtype).to_nested()
+
+def flatten_polylines(paths_XYs):
+    # Ragged form of a nested drawing: all points in one (N, 2) array plus the
+    # offsets at which each polyline starts
+    polylines = [np.asarray(XY, dtype=np.float64).reshape(-1, 2) for XYs in paths_XYs for XY in XYs]
+    lengths = [len(XY) for XY in polylines]
+    points = np.concatenate(polylines) if polylines else np.empty((0, 2))
+    return points, np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+
+def _draw_polylines(canvas, polylines, thickness, line_type, shift):
+    if polylines:
+        cv2.polylines(canvas, polylines, False, 255, thickness, line_type, shift)
+
+@instrumentation.timed('data_preparation.rasterize_polylines')
+def rasterize_polylines(points, offsets, image_offsets=None, img_size=64, fit=False, margin=2,
+                        thickness=1, antialias=False, workers=None):
+    # Renders a ragged batch of polylines into a stacked (B, H, W) uint8 tensor.
+    # `offsets` delimit the polylines within `points`, and `image_offsets` delimit
+    # the polylines belonging to each image (a single image when omitted). With
+    # `fit`, every image is scaled uniformly to fill its canvas within `margin`;
+    # otherwise the coordinates are used as pixel positions.
+    width, height = (img_size, img_size) if np.isscalar(img_size) else img_size
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if image_offsets is None:
+        image_offsets = np.array([0, len(offsets) - 1])
+    image_offsets = np.asarray(image_offsets, dtype=np.int64)
+    num_images = len(image_offsets) - 1
+    point_bounds = offsets[image_offsets]
+
+    if fit and len(points):
+        image_of_point = np.repeat(np.arange(num_images), np.diff(point_bounds))
+        nonempty = np.diff(point_bounds) > 0
+        lower = np.zeros((num_images, 2))
+        upper = np.zeros((num_images, 2))
+        lower[nonempty] = np.minimum.reduceat(points, point_bounds[:-1][nonempty])
+        upper[nonempty] = np.maximum.reduceat(points, point_bounds[:-1][nonempty])
+        extent = np.maximum((upper - lower).max(axis=1), 1e-12)
+        scale = np.minimum(width - 1 - 2 * margin, height - 1 - 2 * margin) / extent
+        centre = (lower + upper) / 2
+        target = np.array([(width - 1) / 2, (height - 1) / 2])
+        points = (points - centre[image_of_point]) * scale[image_of_point, None] + target
+
+    # Sub-pixel precision is only worth it when anti-aliasing
+    shift = 4 if antialias else 0
+    line_type = cv2.LINE_AA if antialias else cv2.LINE_8
+    pixels = np.round(points * (1 << shift)).astype(np.int32)
+    polylines = [pixels[start:stop] for start, stop in zip(offsets[:-1], offsets[1:]) if stop - start > 1]
+    keep = np.diff(offsets) > 1
+    polyline_image = np.repeat(np.arange(num_images), np.diff(image_offsets))[keep]
+    bounds = np.searchsorted(polyline_image, np.arange(num_images + 1))
+
+    images = np.zeros((num_images, height, width), dtype=np.uint8)
+    instrumentation.count('images_rasterized', num_images)
+    jobs = [(images[b], polylines[bounds[b]:bounds[b + 1]], thickness, line_type, shift) for b in range(num_images)]
+    if workers and workers > 1 and num_images > 1:
+        # OpenCV releases the GIL while drawing
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda job: _draw_polylines(*job), jobs))
+    else:
+        for job in jobs:
+            _draw_polylines(*job)
+    return images
+
+def rasterize_drawings(drawings, img_size=64, **kwargs):
+    # Batch of nested drawings (each in read_csv's path_XYs form) to (B, H, W)
+    flattened = [flatten_polylines(paths_XYs) for paths_XYs in drawings]
+    points = np.concatenate([p for p, _ in flattened]) if flattened else np.empty((0, 2))
+    point_starts = np.cumsum([0] + [len(p) for p, _ in flattened])
+    offsets = np.concatenate([[0]] + [o[1:] + start for (_, o), start in zip(flattened, point_starts)])
+    image_offsets = np.cumsum([0] + [len(o) - 1 for _, o in flattened])
+    return rasterize_polylines(points, offsets, image_offsets, img_size, **kwargs)
 
 def convert_to_image(paths_XYs, img_size=64):
-    canvas = np.zeros((img_size, img_size), dtype=np.uint8)
-    for XYs in paths_XYs:
-        for XY in XYs:
-            for i in range(len(XY) - 1):
-                cv2.line(canvas, tuple(XY[i]), tuple(XY[i + 1]), 255, 1)
-    return canvas
+    return rasterize_drawings([paths_XYs], img_size)[0]
 
 def load_data(data_dir, img_size=64, add_shape_in_folder=True):
     data = []
     labels = []
-    shape_classes = ['ellipse', 'circle', 'rounded_rectangle', 'rectangle', 'square', 'triangle', 'star']
 
-    for label, shape in enumerate(shape_classes):
+    for label, shape in enumerate(SHAPE_CLASSES):
 
         if add_shape_in_folder is True:
             shape_dir = os.path.join(data_dir, shape)
         else:
             shape_dir = data_dir
 
-        print(f"Checking directory: {shape_dir}")  # Debug info
+        instrumentation.debug(f"Checking directory: {shape_dir}")
 
         if os.path.exists(shape_dir):
             for filename in os.listdir(shape_dir):
                 if filename.endswith('.png'):
                     img_path = os.path.join(shape_dir, filename)
-                    print(f"Found image: {img_path}")  # Debug info
+                    instrumentation.debug(f"Found image: {img_path}")
                     img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
                     if img is not None:
                         img = cv2.resize(img, (img_size, img_size))
                         data.append(img)
                         labels.append(label)
+                        instrumentation.count('images_decoded')
 
     if not data:
         raise ValueError("No data found. Please check the data directory and files.")
@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from .data_preparation import SHAPE_CLASSES, draw_shape
+
+INDEX_FILE = 'index.json'
+
+
+def shard_rng(seed, shard_index):
+    # Each shard draws from its own stream derived from (seed, shard index), so
+    # the dataset is identical however the shards are spread over workers
+    return np.random.RandomState(np.random.SeedSequence(seed, spawn_key=(shard_index,)).generate_state(4))
+
+
+def generate_samples(num_samples, img_size=64, rng=np.random):
+    images = np.empty((num_samples, img_size, img_size), dtype=np.uint8)
+    labels = np.empty(num_samples, dtype=np.int8)
+    for i in range(num_samples):
+        images[i], labels[i] = draw_shape(rng.choice(SHAPE_CLASSES), img_size, rng)
+    return images, labels
+
+
+def generate_chunk(seed, chunk_index, chunk_size, img_size=64):
+    # One chunk in model input layout: (n, H, W, 1) uint8 images, int64 labels
+    images, labels = generate_samples(chunk_size, img_size, shard_rng(seed, chunk_index))
+    return images[..., None], labels.astype(np.int64)
+
+
+def generate_shard(shard_index, num_samples, seed, img_size, out_dir):
+    images, labels = generate_samples(num_samples, img_size, shard_rng(seed, shard_index))
+    images_file = f'shard_{shard_index:05d}_images.npy'
+    labels_file = f'shard_{shard_index:05d}_labels.npy'
+    np.save(os.path.join(out_dir, images_file), images)
+    np.save(os.path.join(out_dir, labels_file), labels)
+    return {
+        'images': images_file,
+        'labels': labels_file,
+        'count': num_samples,
+        'label_counts': np.bincount(labels, minlength=len(SHAPE_CLASSES)).tolist(),
+    }
+
+
+def generate_synthetic_shards(num_samples, out_dir='synthetic_shards', shard_size=10_000, img_size=64,
+                              seed=0, workers=None):
+    os.makedirs(out_dir, exist_ok=True)
+    counts = [min(shard_size, num_samples - start) for start in range(0, num_samples, shard_size)]
+
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        shards = list(executor.map(generate_shard, range(len(counts)), counts,
+                                   [seed] * len(counts), [img_size] * len(counts), [out_dir] * len(counts)))
+    elapsed = time.perf_counter() - start_time
+
+    index = {
+        'seed': seed,
+        'img_size': img_size,
+        'shard_size': shard_size,
+        'num_samples': num_samples,
+        'classes': SHAPE_CLASSES,
+        'shards': shards,
+    }
+    with open(os.path.join(out_dir, INDEX_FILE), 'w') as f:
+        json.dump(index, f, indent=2)
+
+    print(f"Generated {num_samples} samples in {len(shards)} shards in {elapsed:.2f}s "
+          f"({num_samples / max(elapsed, 1e-9):.0f} samples/s)")
+    return index
+
+
+def iter_shards(shard_dir, mmap=True):
+    # Yields (images, labels) per shard; images are memory-mapped by default
+    with open(os.path.join(shard_dir, INDEX_FILE)) as f:
+        index = json.load(f)
+    for shard in index['shards']:
+        images = np.load(os.path.join(shard_dir, shard['images']), mmap_mode='r' if mmap else None)
+        labels = np.load(os.path.join(shard_dir, shard['labels']))
+        yield images, labels
+
+
+def load_shards(shard_dir):
+    # Whole dataset in generate_synthetic_data's layout: (N, H, W, 1) and labels
+    shards = list(iter_shards(shard_dir, mmap=False))
+    if not shards:
+        raise ValueError("No shards found. Please check the shard directory.")
+    data = np.concatenate([images for images, _ in shards])
+    labels = np.concatenate([labels for _, labels in shards]).astype(np.int64)
+    return data[..., None], labels
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate sharded synthetic shape data in parallel.")
+    parser.add_argument('num_samples', type=int)
+    parser.add_argument('--out-dir', default='synthetic_shards')
+    parser.add_argument('--shard-size', type=int, default=10_000)
+    parser.add_argument('--img-size', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    generate_synthetic_shards(args.num_samples, args.out_dir, args.shard_size, args.img_size,
+                              args.seed, args.workers)
@@ -4,48 +4,60 @@ import numpy as np
 import cv2
 
 # Add the root directory to the system path
-sys.path.append(os.path.dirname(os.path.abspath(__file__ , src)))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.model import load_trained_model
-from src.data_preparation.data_preparation import read_csv
+from src.data_preparation.data_preparation import RaggedCurves, read_curves, rasterize_polylines
 
 
+def regularize_ragged(curves, epsilon=1.5):
+    # Douglas-Peucker on every stroke, each a zero-copy view of the shared buffer;
+    # strokes too short to simplify are kept as they are
+    pieces = []
+    for start, stop in zip(curves.offsets[:-1].tolist(), curves.offsets[1:].tolist()):
+        XY = curves.points[start:stop]
+        pieces.append(cv2.approxPolyDP(XY, epsilon, closed=True).reshape(-1, 2) if stop - start >= 3 else XY)
+    short = np.count_nonzero(curves.segment_lengths < 3)
+    if short:
+        print(f"Warning: Not enough points to regularize {short} curve(s).")
+    points = np.concatenate(pieces) if pieces else curves.points[:0]
+    return RaggedCurves.from_lengths(points, [len(XY) for XY in pieces], curves.path_offsets)
+
+def symmetrize_ragged(curves):
+    # Every stroke followed by its mirror image across the vertical line through
+    # its rightmost point, gathered into a new buffer in one pass
+    lengths = curves.segment_lengths
+    nonempty = lengths > 0
+    max_x = np.zeros(curves.num_segments, dtype=curves.points.dtype)
+    max_x[nonempty] = np.maximum.reduceat(curves.points[:, 0], curves.offsets[:-1][nonempty])
+    segment = np.repeat(np.arange(curves.num_segments), 2 * lengths)
+    position = np.arange(2 * len(curves.points)) - 2 * curves.offsets[:-1][segment]
+    mirrored = position >= lengths[segment]
+    points = curves.points[curves.offsets[:-1][segment] + position % np.maximum(lengths[segment], 1)]
+    points[mirrored, 0] = 2 * max_x[segment[mirrored]] - points[mirrored, 0]
+    return RaggedCurves(points, 2 * curves.offsets, curves.path_offsets)
+
+def complete_ragged(curves):
+    # Closes every non-empty stroke by repeating its first point at the end
+    lengths = curves.segment_lengths
+    new_lengths = lengths + (lengths > 0)
+    segment = np.repeat(np.arange(curves.num_segments), new_lengths)
+    new_offsets = np.concatenate(([0], np.cumsum(new_lengths)))
+    position = np.arange(new_offsets[-1]) - new_offsets[:-1][segment]
+    source = curves.offsets[:-1][segment] + np.where(position < lengths[segment], position, 0)
+    empty = np.count_nonzero(lengths == 0)
+    if empty:
+        print(f"Warning: {empty} curve(s) are empty or invalid.")
+    return RaggedCurves(curves.points[source], new_offsets, curves.path_offsets)
+
+# Nested-list forms of the stages above, for callers holding one path's segments
 def regularize_curve(XYs):
-    for i in range(len(XYs)):
-        XY = np.array(XYs[i], dtype=np.float32)
-        if XY.ndim == 1:
-            XY = XY.reshape(-1, 2)
-        elif XY.ndim == 2 and XY.shape[1] != 2:
-            XY = XY.reshape(-1, 2)
-        if len(XY) < 3:
-            print(f"Warning: Not enough points to regularize curve {i}.")
-            continue
-        epsilon = 1.5
-        approx = cv2.approxPolyDP(XY, epsilon, closed=True)
-        XYs[i] = approx
-    return XYs
+    return regularize_ragged(RaggedCurves.from_nested([XYs])).to_nested()[0]
 
 def symmetrize_curve(XYs):
-    for i in range(len(XYs)):
-        XY = XYs[i]
-        max_x = np.max(XY[:, 0])
-        mirrored_XY = XY.copy()
-        mirrored_XY[:, 0] = max_x - (XY[:, 0] - max_x)
-        XYs[i] = np.vstack([XY, mirrored_XY])
-    return XYs
+    return symmetrize_ragged(RaggedCurves.from_nested([XYs])).to_nested()[0]
 
 def complete_curve(XYs):
-    for i in range(len(XYs)):
-        XY = np.array(XYs[i], dtype=np.float32)
-        if XY.ndim == 1:
-            XY = XY.reshape(-1, 2)
-        elif XY.ndim == 3:
-            XY = XY.squeeze()
-        if XY.shape[0] > 0:
-            XYs[i] = np.vstack([XY, XY[0]])
-        else:
-            print(f"Warning: Curve {i} is empty or invalid.")
-    return XYs
+    return complete_ragged(RaggedCurves.from_nested([XYs])).to_nested()[0]
 
 def apply_color_border(img):
     border_size = 5
@@ -53,29 +65,24 @@ def apply_color_border(img):
     img_with_border = cv2.copyMakeBorder(img, border_size, border_size, border_size, border_size, cv2.BORDER_CONSTANT, value=color)
     return img_with_border
 
-def convert_to_image(paths_XYs, img_size=(256, 256)):
-    canvas = np.zeros((img_size[1], img_size[0]), dtype=np.uint8)
-    for XY in paths_XYs:
-        for i in range(len(XY) - 1):
-            cv2.line(canvas, tuple(XY[i]), tuple(XY[i + 1]), 255, 1)
-    return canvas
+def convert_to_image(curves, img_size=(256, 256)):
+    if not isinstance(curves, RaggedCurves):
+        curves = RaggedCurves.from_nested(curves)
+    return rasterize_polylines(curves.points, curves.offsets, img_size=img_size)[0]
 
 def predict_and_save(input_csv, output_png):
     try:
-        # Read and preprocess data
-        paths_XYs = read_csv(input_csv)
-        if not paths_XYs:
+        # Read the drawing into a single ragged buffer
+        curves = read_curves(input_csv)
+        if curves.num_segments == 0:
             raise ValueError("No data found in CSV file.")
 
-        # Process each curve: regularize, symmetrize, and complete
-        for i in range(len(paths_XYs)):
-            paths_XYs[i] = regularize_curve(paths_XYs[i])
-            paths_XYs[i] = symmetrize_curve(paths_XYs[i])
-            paths_XYs[i] = complete_curve(paths_XYs[i])
+        # Process all curves at once: regularize, symmetrize, and complete
+        curves = complete_ragged(symmetrize_ragged(regularize_ragged(curves)))
 
         # Convert processed curves to image
         img_size = (256, 256)
-        img = convert_to_image(paths_XYs, img_size=img_size)
+        img = convert_to_image(curves, img_size=img_size)
         img = apply_color_border(img)
 
         # Save the final image
@@ -0,0 +1,94 @@
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import tensorflow as tf
+
+from data_preparation.synthetic_shards import generate_chunk
+
+
+def split_indices(num_samples, validation_split=0.2, seed=0):
+    order = np.random.default_rng(seed).permutation(num_samples)
+    num_validation = int(num_samples * validation_split)
+    return np.sort(order[num_validation:]), np.sort(order[:num_validation])
+
+
+def real_chunks(data, labels, indices, chunk_size=256, seed=0, repeat=True):
+    # Reads shuffled chunks of (possibly memory-mapped) samples; each chunk is
+    # gathered in index order so reads from the cache stay mostly sequential
+    def generator():
+        rng = np.random.default_rng(seed)
+        while True:
+            order = rng.permutation(indices)
+            for start in range(0, len(order), chunk_size):
+                chunk = np.sort(order[start:start + chunk_size])
+                yield np.asarray(data[chunk]), np.asarray(labels[chunk], dtype=np.int64)
+            if not repeat:
+                return
+    return generator
+
+
+def synthetic_chunks(img_size=64, chunk_size=256, seed=0, workers=None):
+    # Endless stream of freshly drawn samples from a process pool, with a bounded
+    # number of chunks in flight so memory does not grow with training length
+    def generator():
+        # This runs on a tf.data thread after TensorFlow has started its own
+        # threads, so forking here could copy locks they hold into the workers.
+        # Workers come from a clean forkserver instead (spawned where there is
+        # none), which preloads generate_chunk's module (NumPy and OpenCV). Each
+        # worker also re-imports the launching script, so that script has to
+        # keep its TensorFlow imports under `if __name__ == "__main__"`, as
+        # train.py does, or every worker loads TensorFlow too.
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload([generate_chunk.__module__])
+        else:
+            context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            in_flight = deque()
+            chunk_index = 0
+            max_in_flight = 2 * (workers or multiprocessing.cpu_count())
+            while True:
+                while len(in_flight) < max_in_flight:
+                    in_flight.append(executor.submit(generate_chunk, seed, chunk_index, chunk_size, img_size))
+                    chunk_index += 1
+                yield in_flight.popleft().result()
+    return generator
+
+
+def _chunk_dataset(generator, img_size):
+    signature = (tf.TensorSpec(shape=(None, img_size, img_size, 1), dtype=tf.uint8),
+                 tf.TensorSpec(shape=(None,), dtype=tf.int64))
+    return tf.data.Dataset.from_generator(generator, output_signature=signature).unbatch()
+
+
+def _normalizer(num_classes):
+    def normalize(images, labels):
+        return tf.cast(images, tf.float32) / 255.0, tf.one_hot(labels, num_classes)
+    return normalize
+
+
+def make_training_dataset(real_data, real_labels, indices, num_classes=7, synthetic_fraction=0.5,
+                          batch_size=32, seed=0, workers=None, chunk_size=256, shuffle_buffer=4096):
+    # Interleaves cached real samples with synthetic ones generated on the fly,
+    # normalizes to float32 per batch and prefetches. Memory is bounded by the
+    # shuffle buffer and the chunks in flight, never by the dataset size.
+    img_size = real_data.shape[1]
+    real = _chunk_dataset(real_chunks(real_data, real_labels, indices, chunk_size, seed), img_size)
+    synthetic = _chunk_dataset(synthetic_chunks(img_size, chunk_size, seed, workers), img_size)
+    dataset = tf.data.Dataset.sample_from_datasets(
+        [real, synthetic], weights=[1 - synthetic_fraction, synthetic_fraction], seed=seed)
+    return (dataset
+            .shuffle(shuffle_buffer, seed=seed)
+            .batch(batch_size)
+            .map(_normalizer(num_classes), num_parallel_calls=tf.data.AUTOTUNE)
+            .prefetch(tf.data.AUTOTUNE))
+
+
+def make_eval_dataset(real_data, real_labels, indices, num_classes=7, batch_size=32, chunk_size=256):
+    img_size = real_data.shape[1]
+    dataset = _chunk_dataset(real_chunks(real_data, real_labels, indices, chunk_size, repeat=False), img_size)
+    return (dataset
+            .batch(batch_size)
+            .map(_normalizer(num_classes), num_parallel_calls=tf.data.AUTOTUNE)
+            .prefetch(tf.data.AUTOTUNE))
@@ -20,3 +20,35 @@ def create_model(input_shape=(64, 64, 1), num_classes=7):
 def load_trained_model(model_path):
     model = keras_load_model(model_path)
     return model
+
+def export_weights(model, weights_path):
+    # Flat .npz of every layer's configuration and weights, readable by the
+    # NumPy-only engine in numpy_inference without importing TensorFlow
+    import json
+    import numpy as np
+    layers = []
+    arrays = {}
+    for i, layer in enumerate(model.layers):
+        config = layer.get_config()
+        kind = type(layer).__name__
+        record = {'type': kind}
+        if kind in ('Conv2D', 'Dense'):
+            record['activation'] = config.get('activation', 'linear')
+            arrays[f'layer{i}_kernel'], arrays[f'layer{i}_bias'] = layer.get_weights()
+        if kind == 'Conv2D':
+            if tuple(config['strides']) != (1, 1) or config['padding'] != 'valid':
+                raise ValueError(f"Unsupported Conv2D configuration in layer {layer.name}.")
+        elif kind == 'MaxPooling2D':
+            record['pool_size'] = list(config['pool_size'])
+            record['strides'] = list(config['strides'] or config['pool_size'])
+            if config['padding'] != 'valid':
+                raise ValueError(f"Unsupported MaxPooling2D configuration in layer {layer.name}.")
+        elif kind not in ('Dense', 'Flatten', 'InputLayer'):
+            raise ValueError(f"Unsupported layer type: {kind}")
+        layers.append(record)
+    np.savez(weights_path, layers=np.array(json.dumps(layers)), **arrays)
+
+if __name__ == "__main__":
+    import sys
+    # python model.py model.h5 model.npz
+    export_weights(load_trained_model(sys.argv[1]), sys.argv[2])
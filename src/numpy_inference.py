@@ -0,0 +1,69 @@
+import json
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def _activate(x, activation):
+    if activation == 'relu':
+        return np.maximum(x, 0, out=x)
+    if activation == 'softmax':
+        x = np.exp(x - x.max(axis=-1, keepdims=True))
+        return x / x.sum(axis=-1, keepdims=True)
+    if activation == 'linear':
+        return x
+    raise ValueError(f"Unsupported activation: {activation}")
+
+
+def conv2d(x, kernel, bias):
+    # Valid, stride-1 convolution as one matmul over an im2col view (NHWC)
+    kh, kw, channels, filters = kernel.shape
+    # Windows ordered (kh, kw, C) like the kernel, so channels stay contiguous
+    windows = sliding_window_view(x, (kh, kw, channels), axis=(1, 2, 3))  # (N, H', W', 1, kh, kw, C)
+    n, h, w = windows.shape[:3]
+    columns = windows.reshape(n * h * w, kh * kw * channels)
+    return (columns @ kernel.reshape(kh * kw * channels, filters) + bias).reshape(n, h, w, filters)
+
+
+def max_pool2d(x, pool_size=(2, 2), strides=None):
+    ph, pw = pool_size
+    sh, sw = strides or pool_size
+    if (sh, sw) == (ph, pw):
+        n, h, w, c = x.shape
+        x = x[:, :h // ph * ph, :w // pw * pw]
+        return x.reshape(n, h // ph, ph, w // pw, pw, c).max(axis=(2, 4))
+    windows = sliding_window_view(x, (ph, pw), axis=(1, 2))[:, ::sh, ::sw]
+    return windows.max(axis=(-2, -1))
+
+
+class NumpyModel:
+    def __init__(self, layers, weights):
+        self.layers = layers
+        self.weights = weights
+
+    def forward(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        for i, layer in enumerate(self.layers):
+            kind = layer['type']
+            if kind == 'Conv2D':
+                x = _activate(conv2d(x, *self.weights[i]), layer['activation'])
+            elif kind == 'MaxPooling2D':
+                x = max_pool2d(x, layer['pool_size'], layer['strides'])
+            elif kind == 'Flatten':
+                x = x.reshape(len(x), -1)
+            elif kind == 'Dense':
+                kernel, bias = self.weights[i]
+                x = _activate(x @ kernel + bias, layer['activation'])
+        return x
+
+    def predict(self, x, batch_size=256):
+        x = np.asarray(x)
+        outputs = [self.forward(x[start:start + batch_size]) for start in range(0, len(x), batch_size)]
+        return np.concatenate(outputs) if outputs else np.empty((0,))
+
+
+def load_numpy_model(weights_path):
+    with np.load(weights_path) as archive:
+        layers = json.loads(str(archive['layers']))
+        weights = {i: (archive[f'layer{i}_kernel'].astype(np.float32), archive[f'layer{i}_bias'].astype(np.float32))
+                   for i, layer in enumerate(layers) if layer['type'] in ('Conv2D', 'Dense')}
+    return NumpyModel(layers, weights)
@@ -1,13 +1,19 @@
+import os
+import sys
 import numpy as np
-from model import load_trained_model
-from data_preparation import load_data  # Import the load_data function
 
-# Load the model
-model = load_trained_model('model.h5')
+# Add the root directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from numpy_inference import load_numpy_model
+from data_preparation.dataset_cache import load_data_cached
+
+# Load the model weights exported with `python model.py model.h5 model.npz`
+model = load_numpy_model('model.npz')
 
 # Load new data for prediction
 data_dir = 'synthetic_data'  # Path to the data directory
-new_data, _ = load_data(data_dir)
+new_data, _ = load_data_cached(data_dir)
 
 # Debugging: Check if data is loaded
 if new_data.size == 0:
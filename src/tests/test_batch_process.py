@@ -0,0 +1,44 @@
+import sys
+import os
+import shutil
+import tempfile
+
+# batch_process lives at the repository root
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, ROOT)
+
+from batch_process import output_names, run_batch
+
+
+def test_same_stem_inputs_keep_separate_outputs():
+    # frag0.csv and frag0.svg share a stem, and so do the two copies of
+    # isolated.svg in different directories
+    work = tempfile.mkdtemp()
+    try:
+        inputs = os.path.join(work, 'inputs')
+        os.makedirs(os.path.join(inputs, 'more'))
+        problems = os.path.join(ROOT, 'data', 'problems')
+        for name in ('frag0.csv', 'frag0.svg', 'isolated.svg'):
+            shutil.copy(os.path.join(problems, name), inputs)
+        shutil.copy(os.path.join(problems, 'isolated.svg'), os.path.join(inputs, 'more'))
+        out_dir = os.path.join(work, 'out')
+
+        results = run_batch([inputs], ['complete'], out_dir, workers=1, cache_dir=None)
+        assert all(error is None for _, _, error in results)
+        for name in ('frag0.csv', 'frag0.svg', 'isolated.svg', os.path.join('more', 'isolated.svg')):
+            for suffix in ('_completed.png', '_completed.svg'):
+                assert os.path.exists(os.path.join(out_dir, name + suffix))
+        assert not os.path.exists(os.path.join(out_dir, 'frag0_completed.svg'))
+    finally:
+        shutil.rmtree(work)
+
+
+def test_output_names_are_relative_to_the_common_directory():
+    files = [os.path.join('data', 'a', 'x.svg'), os.path.join('data', 'b', 'x.svg'), os.path.join('data', 'a', 'x.csv')]
+    assert output_names(files) == [os.path.join('a', 'x.svg'), os.path.join('b', 'x.svg'), os.path.join('a', 'x.csv')]
+
+
+if __name__ == "__main__":
+    test_same_stem_inputs_keep_separate_outputs()
+    test_output_names_are_relative_to_the_common_directory()
+    print("batch_process output checks passed")
@@ -0,0 +1,109 @@
+import sys
+import os
+import numpy as np
+from shapely.geometry import LineString
+
+# complete_curves lives at the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from custom_logger import instrumentation
+from complete_curves import EXACT_MATCHING_SIZE, _match_group, _solve_matching, match_endpoints, complete_lines, complete_lines_tiled, IncrementalCompleter
+
+
+def snapped_strokes(seed, count=60, spacing=2):
+    # Strokes on a coarse grid, so endpoints are often equally near or shared
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, 15, (count, 2)) * spacing
+    ends = starts + rng.integers(-2, 3, (count, 2)) * spacing
+    ends[np.all(ends == starts, axis=1)] += spacing
+    return [LineString([start, end]) for start, end in zip(starts.astype(float), ends.astype(float))]
+
+
+def curve_set(curves):
+    return sorted(tuple(np.asarray(curve.coords).ravel()) for curve in curves)
+
+
+def test_odd_cycle_is_matched():
+    # Three strokes ending about 1 apart: every endpoint's best partner forms a
+    # triangle, but two of them must still be joined
+    lines = [LineString([(0, 0), (-50, 0)]), LineString([(1, 0), (60, 0)]), LineString([(0.5, 0.9), (0.5, 70)])]
+    sources, targets = match_endpoints(lines, max_distance=5)
+    assert len(sources) == 1
+    assert (sources[0], targets[0]) == (0, 2)
+    assert len(complete_lines(lines, 5, matching='optimal')) == 2
+
+
+def test_matching_is_one_to_one():
+    rng = np.random.default_rng(0)
+    lines = [LineString(rng.uniform(0, 40, (2, 2))) for _ in range(30)]
+    sources, targets = match_endpoints(lines, max_distance=5)
+    matched = np.concatenate([sources, targets])
+    assert len(np.unique(matched)) == len(matched)
+    assert np.all(sources // 2 != targets // 2)
+
+
+def test_large_group_is_matched_exactly():
+    # A chain of 20 endpoints whose cheapest single links alternate with the
+    # ones an optimal matching needs: picking by cost leaves both ends open
+    size = 20
+    assert size > EXACT_MATCHING_SIZE
+    pairs = np.stack([np.arange(size - 1), np.arange(1, size)], axis=1)
+    costs = np.where(np.arange(size - 1) % 2 == 0, 0.5, 0.4)
+    chosen = _match_group(pairs, costs, np.arange(size - 1), unmatched=2.0)
+    assert sorted(chosen) == list(range(0, size - 1, 2))
+
+
+def test_solver_agrees_with_enumeration():
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        nodes = rng.integers(2, EXACT_MATCHING_SIZE + 1)
+        pairs = np.array([(a, b) for a in range(nodes) for b in range(a + 1, nodes) if rng.random() < 0.4] or [(0, 1)])
+        costs = rng.uniform(0, 2, len(pairs))
+
+        def total(chosen):
+            return costs[chosen].sum() + 2.0 * (len(np.unique(pairs)) - 2 * len(chosen))
+        enumerated = _match_group(pairs, costs, np.arange(len(pairs)), 2.0)
+        solved = _solve_matching(pairs, costs, np.arange(len(pairs)), 2.0)
+        assert np.isclose(total(solved), total(enumerated))
+
+
+def test_solver_out_of_time_stays_one_to_one():
+    rng = np.random.default_rng(2)
+    points = rng.uniform(0, 10, (60, 2))
+    pairs = np.array([(a, b) for a in range(60) for b in range(a + 1, 60)
+                      if np.linalg.norm(points[a] - points[b]) < 3])
+    costs = rng.uniform(0, 2, len(pairs))
+    enabled = instrumentation.enabled
+    instrumentation.configure()
+    instrumentation.reset()
+    chosen = _solve_matching(pairs, costs, np.arange(len(pairs)), 2.0, time_limit=0)
+    assert instrumentation.counters['matching_inexact_groups'] == 1
+    assert len(chosen) and len(np.unique(pairs[chosen])) == 2 * len(chosen)
+    instrumentation.configure(enabled)
+
+
+def test_incremental_matches_batch_on_snapped_input():
+    for seed in range(10):
+        lines = snapped_strokes(seed)
+        completer = IncrementalCompleter(max_distance=3)
+        for line in lines:
+            completer.add_stroke(line)
+        assert curve_set(completer.curves()) == curve_set(complete_lines(lines, 3))
+
+
+def test_tiled_matches_untiled_on_snapped_input():
+    for seed in range(10):
+        lines = snapped_strokes(seed)
+        tiled = complete_lines_tiled(lines, 3, tile_size=7, workers=1)
+        assert curve_set(tiled) == curve_set(complete_lines(lines, 3))
+
+
+if __name__ == "__main__":
+    test_odd_cycle_is_matched()
+    test_matching_is_one_to_one()
+    test_large_group_is_matched_exactly()
+    test_solver_agrees_with_enumeration()
+    test_solver_out_of_time_stays_one_to_one()
+    test_incremental_matches_batch_on_snapped_input()
+    test_tiled_matches_untiled_on_snapped_input()
+    print("complete_curves matching checks passed")
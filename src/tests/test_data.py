@@ -10,7 +10,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..',
 
 # Import necessary modules from the src package
 from src.model import load_trained_model
-from src.data_preparation.data_preparation import load_data
+from src.data_preparation.dataset_cache import load_data_cached
 
 try:
     # Load the model
@@ -18,7 +18,7 @@ try:
 
     # Load and preprocess test data
     test_data_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'data/problems')
-    test_data, test_labels = load_data(test_data_dir, add_shape_in_folder=False)
+    test_data, test_labels = load_data_cached(test_data_dir, add_shape_in_folder=False)
 
     # Normalize test data
     test_data = test_data / 255.0
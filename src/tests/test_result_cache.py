@@ -0,0 +1,48 @@
+import sys
+import os
+import shutil
+import tempfile
+import numpy as np
+
+# result_cache lives at the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from result_cache import RESCAN_FRACTION, ResultCache
+
+
+def directory_size(cache):
+    return sum(size for _, size, _ in cache._entries())
+
+
+def test_overwriting_an_entry_keeps_the_size_exact():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        cache = ResultCache(cache_dir)
+        for _ in range(5):
+            cache.put('ab' * 32, {'values': np.zeros(100)})
+        assert cache._size == directory_size(cache)
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_shared_directory_stays_near_max_bytes():
+    # Two instances stand in for two batch_process workers sharing a cache
+    cache_dir = tempfile.mkdtemp()
+    try:
+        entry_size = 8 * 1000 + 512
+        max_bytes = 64 * entry_size
+        caches = [ResultCache(cache_dir, max_bytes), ResultCache(cache_dir, max_bytes)]
+        slack = len(caches) * (max_bytes * RESCAN_FRACTION + entry_size)
+        largest = 0
+        for i in range(400):
+            caches[i % 2].put(f'{i:064x}', {'values': np.full(1000, i, dtype=np.float64)})
+            largest = max(largest, directory_size(caches[0]))
+        assert largest <= max_bytes + slack
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == "__main__":
+    test_overwriting_an_entry_keeps_the_size_exact()
+    test_shared_directory_stays_near_max_bytes()
+    print("result_cache size checks passed")
@@ -1,71 +1,74 @@
+import os
+import sys
 import numpy as np
-from data_preparation.data_preparation import generate_synthetic_data, load_data
-from model import create_model
-from tensorflow.keras.utils import to_categorical
-
-# Generate synthetic data
-num_synthetic_samples = 1000
-synthetic_data, synthetic_labels = generate_synthetic_data(num_synthetic_samples)
-
-# Load real data
-data_dir = 'synthetic_data'  # Path to real data directory
-real_data, real_labels = load_data(data_dir)
-
-# Ensure the data is of correct shape
-print(f"Synthetic data shape: {synthetic_data.shape}")
-print(f"Real data shape: {real_data.shape}")
-print(f"Synthetic labels shape: {synthetic_labels.shape}")
-print(f"Real labels shape: {real_labels.shape}")
-
-# Normalize data
-synthetic_data = synthetic_data / 255.0
-real_data = real_data / 255.0
-
-# Combine synthetic and real data
-data = np.concatenate((synthetic_data, real_data), axis=0)
-labels = np.concatenate((synthetic_labels, real_labels), axis=0)
-
-# Ensure labels are one-hot encoded
-num_classes = 7  # Adjust this if your number of classes is different
-labels = to_categorical(labels, num_classes=num_classes)
-
-# Print shapes after preprocessing
-print(f"Combined data shape: {data.shape}")
-print(f"Combined labels shape: {labels.shape}")
-
-# Create and compile the model
-model = create_model(input_shape=data.shape[1:], num_classes=num_classes)
-
-# Compile the model with categorical_crossentropy loss
-model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
-
-# Train the model
-history = model.fit(data, labels, epochs=10, batch_size=32, validation_split=0.2)
-
-# Save the model
-model.save('model.h5')
-
-# Optional: Plot training & validation accuracy and loss
-import matplotlib.pyplot as plt
-
-plt.figure(figsize=(12, 4))
-
-# Plot training & validation accuracy
-plt.subplot(1, 2, 1)
-plt.plot(history.history['accuracy'])
-plt.plot(history.history['val_accuracy'])
-plt.title('Model Accuracy')
-plt.xlabel('Epoch')
-plt.ylabel('Accuracy')
-plt.legend(['Train', 'Validation'], loc='upper left')
-
-# Plot training & validation loss
-plt.subplot(1, 2, 2)
-plt.plot(history.history['loss'])
-plt.plot(history.history['val_loss'])
-plt.title('Model Loss')
-plt.xlabel('Epoch')
-plt.ylabel('Loss')
-plt.legend(['Train', 'Validation'], loc='upper left')
-
-plt.show()
+
+# Add the root directory to the system path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from data_preparation.dataset_cache import load_data_cached
+
+if __name__ == "__main__":
+    # TensorFlow is only imported here: the synthetic data workers re-import
+    # this script, and at the top level it would load in every one of them
+    from model import create_model
+    from input_pipeline import split_indices, make_training_dataset, make_eval_dataset
+
+    # Number of synthetic samples drawn on the fly per epoch
+    num_synthetic_samples = 1000
+    batch_size = 32
+    num_classes = 7  # Adjust this if your number of classes is different
+
+    # Load real data (memory-mapped from the dataset cache)
+    data_dir = 'synthetic_data'  # Path to real data directory
+    real_data, real_labels = load_data_cached(data_dir)
+    print(f"Real data shape: {real_data.shape}")
+    print(f"Real labels shape: {real_labels.shape}")
+
+    # Hold out part of the real data for validation
+    train_indices, val_indices = split_indices(len(real_labels), validation_split=0.2)
+    synthetic_fraction = num_synthetic_samples / (num_synthetic_samples + len(train_indices))
+    steps_per_epoch = (num_synthetic_samples + len(train_indices)) // batch_size
+
+    # Streaming pipeline: real and synthetic samples interleaved, normalized to
+    # float32 per batch, labels one-hot encoded
+    train_dataset = make_training_dataset(real_data, real_labels, train_indices, num_classes=num_classes,
+                                          synthetic_fraction=synthetic_fraction, batch_size=batch_size)
+    val_dataset = make_eval_dataset(real_data, real_labels, val_indices, num_classes=num_classes,
+                                    batch_size=batch_size)
+
+    # Create and compile the model
+    model = create_model(input_shape=real_data.shape[1:], num_classes=num_classes)
+
+    # Compile the model with categorical_crossentropy loss
+    model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+
+    # Train the model
+    history = model.fit(train_dataset, epochs=10, steps_per_epoch=steps_per_epoch, validation_data=val_dataset)
+
+    # Save the model
+    model.save('model.h5')
+
+    # Optional: Plot training & validation accuracy and loss
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(12, 4))
+
+    # Plot training & validation accuracy
+    plt.subplot(1, 2, 1)
+    plt.plot(history.history['accuracy'])
+    plt.plot(history.history['val_accuracy'])
+    plt.title('Model Accuracy')
+    plt.xlabel('Epoch')
+    plt.ylabel('Accuracy')
+    plt.legend(['Train', 'Validation'], loc='upper left')
+
+    # Plot training & validation loss
+    plt.subplot(1, 2, 2)
+    plt.plot(history.history['loss'])
+    plt.plot(history.history['val_loss'])
+    plt.title('Model Loss')
+    plt.xlabel('Epoch')
+    plt.ylabel('Loss')
+    plt.legend(['Train', 'Validation'], loc='upper left')
+
+    plt.show()
@@ -0,0 +1,237 @@
+import re
+import xml.etree.ElementTree as ET
+import numpy as np
+from svgpathtools import Arc
+
+from segment_array import SegmentArray, LINE, QUADRATIC, CUBIC, ARC, concatenate
+from custom_logger import instrumentation
+
+COMMANDS = re.compile(r'([MmZzLlHhVvCcSsQqTtAa])')
+NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+# Arc flags are single digits and may be written without separators ("a5 5 0 011 1")
+ARC_ARGUMENT = re.compile(r'[\s,]*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)')
+ARC_FLAG = re.compile(r'[\s,]*([01])')
+SHAPES = {'path', 'line', 'polyline', 'polygon', 'rect', 'circle', 'ellipse'}
+
+
+def _arc_numbers(text):
+    numbers = []
+    position = 0
+    while True:
+        match = (ARC_FLAG if len(numbers) % 7 in (3, 4) else ARC_ARGUMENT).match(text, position)
+        if match is None:
+            return np.array(numbers, dtype=np.float64)
+        numbers.append(float(match.group(1)))
+        position = match.end()
+
+
+def _lines(starts, ends):
+    delta = ends - starts
+    return np.stack([starts, starts + delta / 3, starts + 2 * delta / 3, ends], axis=1)
+
+
+def _quadratics(starts, controls, ends):
+    return np.stack([starts, starts + 2 * (controls - starts) / 3, ends + 2 * (controls - ends) / 3, ends], axis=1)
+
+
+def _chain(current, offsets, relative):
+    # End points of consecutive segments given as absolute points or as offsets
+    # from the end of the previous one, and the start points that go with them.
+    # Offsets are summed onto `current` one after another, so the ends round
+    # exactly as a segment-by-segment parser's would.
+    ends = np.cumsum(np.concatenate([current[None], offsets]), axis=0)[1:] if relative else offsets
+    return np.concatenate([current[None], ends[:-1]]), ends
+
+
+def _command_runs(d):
+    # (command letter, argument text) per run of one command. A repeated letter
+    # only restates the command ("L1 2 L3 4" is "L1 2 3 4"), so its arguments are
+    # joined to be converted together; repeated movetos start new subpaths and
+    # stay apart.
+    parts = COMMANDS.split(d)
+    letters, texts = parts[1::2], parts[2::2]
+    start = 0
+    while start < len(letters):
+        letter = letters[start]
+        stop = start + 1
+        if letter not in 'MmZz':
+            while stop < len(letters) and letters[stop] == letter:
+                stop += 1
+        yield letter, texts[start] if stop == start + 1 else ' '.join(texts[start:stop])
+        start = stop
+
+
+def parse_path_data(d):
+    # SegmentArray of a `d` attribute. Every run of one command is converted in
+    # a few array operations instead of one svgpathtools object per segment.
+    # Arcs become cubic pieces tagged ARC (degenerate ones become lines).
+    points, kinds = [], []
+
+    def emit(segment_points, kind):
+        points.append(segment_points)
+        kinds.append(np.full(len(segment_points), kind, dtype=np.int8))
+
+    current = np.zeros(2)
+    subpath_start = np.zeros(2)
+    # ('CS' or 'QT', point): the control the next S or T reflects, set only by
+    # the commands it may follow
+    last_control = None
+    for letter, text in _command_runs(d or ''):
+        command = letter.upper()
+        relative = letter.islower()
+        if command == 'A':
+            values = _arc_numbers(text)
+        else:
+            values = np.array(NUMBER.findall(text), dtype=np.float64)
+        reflected = last_control
+        last_control = None
+
+        if command == 'Z':
+            if np.any(current != subpath_start):
+                emit(_lines(current[None], subpath_start[None]), LINE)
+            current = subpath_start
+            continue
+        if command == 'M':
+            pairs = values[:len(values) // 2 * 2].reshape(-1, 2)
+            if not len(pairs):
+                continue
+            current = subpath_start = current + pairs[0] if relative else pairs[0]
+            # Further pairs are implicit linetos
+            values, command = pairs[1:].ravel(), 'L'
+        if command in 'LHV':
+            if command == 'L':
+                offsets = values[:len(values) // 2 * 2].reshape(-1, 2)
+            else:
+                axis = 0 if command == 'H' else 1
+                offsets = np.zeros((len(values), 2)) if relative else np.repeat(current[None], len(values), axis=0)
+                offsets[:, axis] = values
+            if len(offsets):
+                starts, ends = _chain(current, offsets, relative)
+                emit(_lines(starts, ends), LINE)
+                current = ends[-1]
+        elif command in 'CS':
+            size = 3 if command == 'C' else 2
+            groups = values[:len(values) // (2 * size) * 2 * size].reshape(-1, size, 2)
+            if not len(groups):
+                continue
+            starts, ends = _chain(current, groups[:, -1], relative)
+            given = groups[:, :-1] + (starts[:, None] if relative else 0)
+            if command == 'C':
+                first_controls, second_controls = given[:, 0], given[:, 1]
+            else:
+                # Each first control reflects the previous curve's second control
+                second_controls = given[:, 0]
+                first = reflected[1] if reflected is not None and reflected[0] == 'CS' else starts[0]
+                previous = np.concatenate([[first], second_controls[:-1]])
+                first_controls = 2 * starts - previous
+            emit(np.stack([starts, first_controls, second_controls, ends], axis=1), CUBIC)
+            current = ends[-1]
+            last_control = ('CS', second_controls[-1])
+        elif command == 'Q':
+            groups = values[:len(values) // 4 * 4].reshape(-1, 2, 2)
+            if not len(groups):
+                continue
+            starts, ends = _chain(current, groups[:, 1], relative)
+            controls = groups[:, 0] + (starts if relative else 0)
+            emit(_quadratics(starts, controls, ends), QUADRATIC)
+            current = ends[-1]
+            last_control = ('QT', controls[-1])
+        elif command == 'T':
+            # Each control depends on the previous one, so these go one at a time
+            control = reflected[1] if reflected is not None and reflected[0] == 'QT' else None
+            for end in values[:len(values) // 2 * 2].reshape(-1, 2):
+                end = current + end if relative else end
+                control = 2 * current - control if control is not None else current
+                emit(_quadratics(current[None], control[None], end[None]), QUADRATIC)
+                current = end
+            if control is not None:
+                last_control = ('QT', control)
+        elif command == 'A':
+            for rx, ry, rotation, large_arc, sweep, x, y in values[:len(values) // 7 * 7].reshape(-1, 7):
+                end = current + (x, y) if relative else np.array([x, y])
+                if np.all(end == current):
+                    continue
+                if rx == 0 or ry == 0:
+                    emit(_lines(current[None], end[None]), LINE)
+                else:
+                    arc = Arc(complex(*current), complex(abs(rx), abs(ry)), rotation, bool(large_arc), bool(sweep),
+                              complex(*end))
+                    # One cubic per quarter turn keeps the approximation close
+                    curves = arc.as_cubic_curves(max(1, int(np.ceil(abs(arc.delta) / 90))))
+                    pieces = np.array([curve.bpoints() for curve in curves])
+                    pieces = np.stack([pieces.real, pieces.imag], axis=-1)
+                    # Pin the ends to the exact path points
+                    pieces[0, 0], pieces[-1, 3] = current, end
+                    emit(pieces, ARC)
+                current = end
+
+    if not points:
+        return SegmentArray.empty()
+    return SegmentArray(np.concatenate(points), np.concatenate(kinds))
+
+
+def _float(attributes, name):
+    # Leading number of a length attribute ("12.5px" -> 12.5)
+    match = NUMBER.match(attributes.get(name, '').strip())
+    return float(match.group()) if match else 0.0
+
+
+def element_segments(tag, attributes):
+    # SegmentArray of one shape element, converted the way svg2paths converts it
+    if tag == 'path':
+        return parse_path_data(attributes.get('d', ''))
+    if tag == 'line':
+        start = np.array([_float(attributes, 'x1'), _float(attributes, 'y1')])
+        end = np.array([_float(attributes, 'x2'), _float(attributes, 'y2')])
+        return SegmentArray(_lines(start[None], end[None]), [LINE])
+    if tag in ('polyline', 'polygon'):
+        values = np.array(NUMBER.findall(attributes.get('points', '')), dtype=np.float64)
+        points = values[:len(values) // 2 * 2].reshape(-1, 2)
+        if tag == 'polygon' and len(points) and np.any(points[0] != points[-1]):
+            points = np.concatenate([points, points[:1]])
+        return SegmentArray.lines(points[:-1], points[1:])
+    if tag == 'rect':
+        x, y = _float(attributes, 'x'), _float(attributes, 'y')
+        width, height = _float(attributes, 'width'), _float(attributes, 'height')
+        rx, ry = _float(attributes, 'rx'), _float(attributes, 'ry')
+        rx, ry = min(rx or ry, width / 2), min(ry or rx, height / 2)
+        if not (rx and ry):
+            return parse_path_data(f'M{x},{y} H{x + width} V{y + height} H{x} z')
+        return parse_path_data(f'M{x + rx},{y} H{x + width - rx} A{rx},{ry} 0 0 1 {x + width},{y + ry} '
+                               f'V{y + height - ry} A{rx},{ry} 0 0 1 {x + width - rx},{y + height} '
+                               f'H{x + rx} A{rx},{ry} 0 0 1 {x},{y + height - ry} '
+                               f'V{y + ry} A{rx},{ry} 0 0 1 {x + rx},{y} z')
+    # Circles and ellipses: two half arcs starting from the leftmost point
+    cx, cy = _float(attributes, 'cx'), _float(attributes, 'cy')
+    rx = _float(attributes, 'r') if tag == 'circle' else _float(attributes, 'rx')
+    ry = _float(attributes, 'r') if tag == 'circle' else _float(attributes, 'ry')
+    return parse_path_data(f'M{cx - rx},{cy} a{rx},{ry} 0 1,0 {2 * rx},0 a{rx},{ry} 0 1,0 {-2 * rx},0')
+
+
+def iter_svg_paths(source, with_attributes=False):
+    # Yields one SegmentArray per shape element (path, line, polyline, polygon,
+    # rect, circle, ellipse) while the document is still being read, in
+    # document order, with the element's attributes alongside when asked.
+    # Finished elements are dropped from the tree straight away, so memory does
+    # not grow with the number of paths. Like svg2paths, transforms are ignored.
+    # `source` is a file name or a binary file object.
+    stack = []
+    for event, element in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            stack.append(element)
+            continue
+        stack.pop()
+        tag = element.tag.rpartition('}')[2]
+        if tag in SHAPES:
+            segments = element_segments(tag, element.attrib)
+            instrumentation.count('svg_paths_streamed')
+            instrumentation.count('svg_segments_streamed', len(segments))
+            yield (segments, dict(element.attrib)) if with_attributes else segments
+        if stack:
+            # Always the last child left, since earlier ones were removed already
+            stack[-1].remove(element)
+
+
+def read_svg_segments(source):
+    # Every segment of a document in one SegmentArray
+    return concatenate(iter_svg_paths(source))
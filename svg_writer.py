@@ -0,0 +1,177 @@
+import os
+import numpy as np
+
+from segment_array import SegmentArray, LINE, QUADRATIC
+
+
+def _format(values, precision):
+    # Shortest fixed-point text of every value: no trailing zeros, no "-0"
+    text = np.char.mod(f'%.{precision}f', values)
+    if precision > 0:
+        text = np.char.rstrip(np.char.rstrip(text, '0'), '.')
+    text[(text == '-0') | (text == '')] = '0'
+    return text.tolist()
+
+
+def _round(values, precision):
+    scale = 10.0 ** precision
+    return np.round(np.asarray(values, dtype=np.float64) * scale) / scale
+
+
+def path_data(segments, precision=3, relative=True):
+    # One `d` string for a whole SegmentArray (or svgpathtools segments). Runs of
+    # contiguous segments share a single moveto, a run that returns to its start
+    # with a line ends in "z", and repeated commands are left implicit. Coordinates
+    # are rounded before relative offsets are taken, so rounding never accumulates.
+    if not isinstance(segments, SegmentArray):
+        segments = SegmentArray.from_segments(segments)
+    n = len(segments)
+    if n == 0:
+        return ''
+    start = _round(segments.start, precision)
+    end = _round(segments.end, precision)
+    # Quadratics are written with their original control point, cubics in full
+    quad_control = _round((3 * segments.control1 - segments.start) / 2, precision)
+    is_line = segments.kinds == LINE
+    is_quad = segments.kinds == QUADRATIC
+    is_cubic = ~(is_line | is_quad)
+
+    origin = start if relative else np.zeros_like(start)
+    coords = np.full((n, 6), np.nan)
+    coords[is_line, :2] = end[is_line] - origin[is_line]
+    coords[is_quad, :2] = quad_control[is_quad] - origin[is_quad]
+    coords[is_quad, 2:4] = end[is_quad] - origin[is_quad]
+    coords[is_cubic] = np.concatenate([_round(segments.control1[is_cubic], precision),
+                                       _round(segments.control2[is_cubic], precision),
+                                       end[is_cubic]], axis=1) - np.tile(origin[is_cubic], 3)
+    coords = _round(coords, precision)
+    counts = np.where(is_line, 2, np.where(is_quad, 4, 6))
+    numbers = _format(coords[~np.isnan(coords)], precision)
+
+    # Moves to the start of every run: absolute for the first, relative after
+    new_run = np.ones(n, dtype=bool)
+    new_run[1:] = np.any(start[1:] != end[:-1], axis=1)
+    moves = start[new_run].copy()
+    if relative:
+        run_starts = np.flatnonzero(new_run)
+        moves[1:] -= end[run_starts[1:] - 1]
+    moves = _format(_round(moves, precision).ravel(), precision)
+    # A run closes with "z" when its last segment is a line back to its start
+    run_id = np.cumsum(new_run) - 1
+    run_start = start[new_run][run_id]
+    last_in_run = np.ones(n, dtype=bool)
+    last_in_run[:-1] = new_run[1:]
+    closes = last_in_run & is_line & np.all(end == run_start, axis=1)
+
+    letters = np.where(is_line, 'l', np.where(is_quad, 'q', 'c'))
+    if not relative:
+        letters = np.char.upper(letters)
+    letters = letters.tolist()
+    parts = []
+    previous = None
+    position = 0
+    move = 0
+    for i in range(n):
+        if new_run[i]:
+            parts.append(f"{'m' if relative and move else 'M'}{moves[2 * move]} {moves[2 * move + 1]}")
+            move += 1
+            previous = None
+        count = counts[i]
+        if closes[i]:
+            parts.append('z')
+        else:
+            command = letters[i]
+            # Repeated commands may be omitted, except right after a moveto
+            prefix = command if command != previous else ' '
+            parts.append(prefix + ' '.join(numbers[position:position + count]))
+            previous = command
+        position += count
+    return ''.join(parts)
+
+
+def polyline_data(polylines, precision=3, relative=True, closed=False):
+    # One `d` string for any number of (N, 2) polylines. A polyline that starts
+    # where the previous one ended continues its subpath; any other starts a new
+    # one, and with `closed` every polyline is its own subpath ending in "z".
+    parts = []
+    current = None
+    for points in polylines:
+        points = _round(np.asarray(points, dtype=np.float64).reshape(-1, 2), precision)
+        if len(points) < 2:
+            continue
+        if closed and np.array_equal(points[0], points[-1]):
+            points = points[:-1]
+        if current is not None and not closed and np.array_equal(points[0], current):
+            # Implicit lineto: the previous command was already one
+            offsets = np.diff(points, axis=0) if relative else points[1:]
+            parts.append(' ' + ' '.join(_format(_round(offsets, precision).ravel(), precision)))
+        else:
+            if relative:
+                move = points[0] - current if current is not None else points[0]
+                offsets = np.diff(points, axis=0)
+            else:
+                move, offsets = points[0], points[1:]
+            numbers = _format(_round(np.concatenate([move, offsets.ravel()]), precision), precision)
+            command = 'm' if relative and current is not None else 'M'
+            parts.append(f"{command}{numbers[0]} {numbers[1]}{'l' if relative else 'L'}{' '.join(numbers[2:])}"
+                         + ('z' if closed else ''))
+        current = points[0] if closed else points[-1]
+    return ''.join(parts)
+
+
+class SVGWriter:
+    # Streams an SVG document straight to a file: every path is written as soon
+    # as it is added, and styling lives on the enclosing group rather than on
+    # each element.
+    def __init__(self, file, width, height, precision=3, relative=True, stroke='black', stroke_width=2,
+                 view_box=None):
+        self.owns_file = isinstance(file, (str, os.PathLike))
+        self.file = open(file, 'w') if self.owns_file else file
+        self.precision = precision
+        self.relative = relative
+        self.group = None
+        self.group_open = False
+        view_box = view_box or (0, 0, width, height)
+        self.file.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+                        f'viewBox="{" ".join(str(v) for v in view_box)}">\n')
+        self.begin_group(stroke, stroke_width)
+
+    def begin_group(self, stroke='black', stroke_width=2, dash=None):
+        # The group is only written once it receives a path
+        self.end_group()
+        dash_attribute = f' stroke-dasharray="{dash}"' if dash else ''
+        self.group = f'<g fill="none" stroke="{stroke}" stroke-width="{stroke_width}"{dash_attribute}>\n'
+
+    def end_group(self):
+        if self.group_open:
+            self.file.write('</g>\n')
+        self.group = None
+        self.group_open = False
+
+    def _write_path(self, d):
+        if d:
+            if self.group and not self.group_open:
+                self.file.write(self.group)
+                self.group_open = True
+            self.file.write(f'<path d="{d}"/>\n')
+
+    def write_segments(self, segments):
+        self._write_path(path_data(segments, self.precision, self.relative))
+
+    def write_polylines(self, polylines, closed=False):
+        self._write_path(polyline_data(polylines, self.precision, self.relative, closed))
+
+    def close(self):
+        if self.file is None:
+            return
+        self.end_group()
+        self.file.write('</svg>\n')
+        if self.owns_file:
+            self.file.close()
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
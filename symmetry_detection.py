@@ -1,28 +1,212 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from svgpathtools import svg2paths2
+from matplotlib.colors import to_hex
+from scipy.spatial import cKDTree
+from sampling import flatten_segments
+from svg_writer import SVGWriter
+from svg_stream import iter_svg_paths
+from custom_logger import instrumentation
 
 def reflect_points_across_vertical(points, x_line):
-    return np.array([[2 * x_line - x, y] for x, y in points])
+    points = np.asarray(points, dtype=np.float64)
+    return np.column_stack([2 * x_line - points[:, 0], points[:, 1]])
 
 def reflect_points_across_horizontal(points, y_line):
-    return np.array([[x, 2 * y_line - y] for x, y in points])
+    points = np.asarray(points, dtype=np.float64)
+    return np.column_stack([points[:, 0], 2 * y_line - points[:, 1]])
 
 def reflect_points_across_line(points, line_point, line_direction):
-    line_point = np.array(line_point)
-    line_direction = np.array(line_direction) / np.linalg.norm(line_direction)
-    reflected_points = []
-    for point in points:
-        point = np.array(point)
-        projection_length = np.dot(point - line_point, line_direction)
-        projection = line_point + projection_length * line_direction
-        reflection = 2 * projection - point
-        reflected_points.append(reflection)
-    return np.array(reflected_points)
+    points = np.asarray(points, dtype=np.float64)
+    line_point = np.array(line_point, dtype=np.float64)
+    line_direction = np.array(line_direction, dtype=np.float64) / np.linalg.norm(line_direction)
+    projection_length = (points - line_point) @ line_direction
+    projection = line_point + projection_length[:, None] * line_direction
+    return 2 * projection - points
 
+def resample_path(path, num_points=64, closed=False):
+    # Evenly spaced points by arc length along all segments of a path; the jumps
+    # between separate segments carry no length and are never interpolated
+    segments = [np.asarray(segment, dtype=np.float64).reshape(-1, 2) for segment in path if len(segment)]
+    points = np.concatenate(segments)
+    if len(points) == 1:
+        return np.repeat(points, num_points, axis=0)
+    lengths = np.linalg.norm(np.diff(points, axis=0), axis=1)
+    lengths[np.cumsum([len(segment) for segment in segments])[:-1] - 1] = 0
+    arc_length = np.concatenate(([0], np.cumsum(lengths)))
+    if arc_length[-1] == 0:
+        return np.repeat(points[:1], num_points, axis=0)
+
+    targets = np.linspace(0, arc_length[-1], num_points, endpoint=not closed)
+    index = np.clip(np.searchsorted(arc_length, targets, side='right') - 1, 0, len(points) - 2)
+    span = lengths[index]
+    fraction = np.divide(targets - arc_length[index], span, out=np.zeros_like(targets), where=span > 0)
+    return points[index] + fraction[:, None] * (points[index + 1] - points[index])
+
+def is_closed_path(path, tolerance=1e-6):
+    segments = [segment for segment in path if len(segment)]
+    if not segments:
+        return False
+    first, last = np.asarray(segments[0][0]), np.asarray(segments[-1][-1])
+    return bool(np.linalg.norm(first - last) <= tolerance * max(1.0, np.abs(first).max()))
+
+def _reflection_residuals(normalized, tree, slots, angles, offsets, chunk_points):
+    # Mean nearest-neighbour distance after reflecting each normalized cloud about
+    # the axes (angles, offsets) of shape (paths, candidates), in bounded chunks
+    num_paths, num_candidates = angles.shape
+    num_points = normalized.shape[1]
+    normals = np.stack([-np.sin(angles), np.cos(angles)], axis=-1)
+    residuals = np.empty((num_paths, num_candidates))
+    step = max(1, chunk_points // (num_candidates * num_points))
+    for start in range(0, num_paths, step):
+        chunk = slice(start, start + step)
+        projection = np.einsum('pmi,pki->pkm', normalized[chunk], normals[chunk]) - offsets[chunk, :, None]
+        reflected = normalized[chunk, None] - 2 * projection[..., None] * normals[chunk, :, None, :]
+        reflected[..., 0] += slots[chunk, None, None]
+        distances, _ = tree.query(reflected.reshape(-1, 2), workers=-1)
+        residuals[chunk] = distances.reshape(-1, num_candidates, num_points).mean(axis=2)
+    return residuals
+
+@instrumentation.timed('symmetry_detection.detect_reflection_axes')
+def detect_reflection_axes(path_XYs, num_angles=24, num_offsets=3, max_offset=0.1,
+                           num_points=32, num_refine=2, top_k=3, chunk_points=1_000_000):
+    # Ranks candidate reflection axes for every path. A coarse pass scores the
+    # principal axes and a grid of angles through each centroid; the best few are
+    # then refined over nearby angles and offsets. All candidates of all paths are
+    # reflected as one batch and scored by the mean nearest-neighbour distance from
+    # the reflected cloud back to the original one. Returns, per path, a list of
+    # (line_point, line_direction, residual) sorted by residual (lower is better);
+    # residuals are in drawing units.
+    if not path_XYs:
+        return []
+    # Sparse clouds are reflected; the dense ones they are matched against keep
+    # the residual floor well below the sample spacing
+    closed = [is_closed_path(path) for path in path_XYs]
+    dense = np.stack([resample_path(path, 4 * num_points, closed=c) for path, c in zip(path_XYs, closed)])
+    centroids = dense.mean(axis=1)
+    scales = np.sqrt(((dense - centroids[:, None]) ** 2).sum(axis=2).mean(axis=1))
+    scales[scales == 0] = 1
+    dense = (dense - centroids[:, None]) / scales[:, None, None]
+    normalized = dense[:, ::4]
+    num_paths = len(dense)
+
+    # Every normalized cloud sits in its own slot along x, far enough apart that a
+    # reflected point's nearest neighbour always belongs to its own path
+    radius = np.linalg.norm(dense, axis=2).max()
+    spacing = 4 * (radius + max_offset) + 1
+    slots = np.arange(num_paths) * spacing
+    tree = cKDTree((dense + np.stack([slots, np.zeros(num_paths)], axis=1)[:, None]).reshape(-1, 2))
+
+    # Coarse pass: principal directions seed a uniform grid of angles
+    covariance = np.einsum('pmi,pmj->pij', normalized, normalized) / num_points
+    _, eigenvectors = np.linalg.eigh(covariance)
+    principal = np.arctan2(eigenvectors[:, 1, :], eigenvectors[:, 0, :])
+    grid = np.broadcast_to(np.linspace(0, np.pi, num_angles, endpoint=False), (num_paths, num_angles))
+    coarse_angles = np.concatenate([principal % np.pi, grid], axis=1)
+    coarse_offsets = np.zeros_like(coarse_angles)
+    coarse = _reflection_residuals(normalized, tree, slots, coarse_angles, coarse_offsets, chunk_points)
+
+    # Refinement around the best coarse angles
+    angle_step = np.pi / num_angles
+    best = np.take_along_axis(coarse_angles, np.argsort(coarse, axis=1)[:, :num_refine], axis=1)
+    deltas = np.linspace(-angle_step / 2, angle_step / 2, 5)
+    offsets = np.linspace(-max_offset, max_offset, num_offsets)
+    shape = best.shape + (len(deltas), len(offsets))
+    fine_angles = np.broadcast_to(best[:, :, None, None] + deltas[:, None], shape)
+    fine_offsets = np.broadcast_to(offsets, shape)
+    fine_angles = fine_angles.reshape(num_paths, -1) % np.pi
+    fine_offsets = fine_offsets.reshape(num_paths, -1)
+    fine = _reflection_residuals(normalized, tree, slots, fine_angles, fine_offsets, chunk_points)
+    instrumentation.count('reflection_axes_scored', coarse.size + fine.size)
+
+    angles = np.concatenate([coarse_angles, fine_angles], axis=1)
+    offsets = np.concatenate([coarse_offsets, fine_offsets], axis=1)
+    residuals = np.concatenate([coarse, fine], axis=1)
+    ranked_axes = []
+    for p in range(num_paths):
+        axes = []
+        kept = []
+        for k in np.argsort(residuals[p], kind='stable'):
+            # Skip near-duplicates of an axis that already ranks higher
+            if any(abs((angles[p, k] - angles[p, j] + np.pi / 2) % np.pi - np.pi / 2) < angle_step
+                   and abs(offsets[p, k] - offsets[p, j]) <= max_offset for j in kept):
+                continue
+            kept.append(k)
+            normal = np.array([-np.sin(angles[p, k]), np.cos(angles[p, k])])
+            line_point = centroids[p] + offsets[p, k] * scales[p] * normal
+            line_direction = np.array([np.cos(angles[p, k]), np.sin(angles[p, k])])
+            axes.append((line_point, line_direction, residuals[p, k] * scales[p]))
+            if len(axes) == top_k:
+                break
+        ranked_axes.append(axes)
+    return ranked_axes
+
+def rotate_points(points, centre, angle):
+    points = np.asarray(points, dtype=np.float64)
+    cos_a, sin_a = np.cos(angle), np.sin(angle)
+    offset = points - centre
+    return np.column_stack([cos_a * offset[:, 0] - sin_a * offset[:, 1],
+                            sin_a * offset[:, 0] + cos_a * offset[:, 1]]) + centre
+
+@instrumentation.timed('symmetry_detection.detect_rotational_symmetry')
+def detect_rotational_symmetry(path_XYs, num_points=256, max_order=12, threshold=0.85, flatness=1e-3):
+    # Finds the order n of C_n rotational symmetry of every closed path. Each path
+    # is resampled by arc length and described by two rotation-invariant signatures,
+    # the distance to its centroid and the turning angle between samples. A C_n
+    # symmetric curve repeats both n times, so their spectra (one batched FFT over
+    # all paths) only carry energy at multiples of n; the order is the largest n
+    # whose multiples hold at least `threshold` of the energy. Returns, per path,
+    # (order, centre, score): order 1 means no rotational symmetry (open paths
+    # included) and order 0 means continuous symmetry, i.e. a circle.
+    results = [(1, None, 0.0)] * len(path_XYs)
+    closed = [p for p, path in enumerate(path_XYs) if is_closed_path(path)]
+    instrumentation.count('rotation_paths_checked', len(closed))
+    if not closed:
+        return results
+    curves = np.stack([resample_path(path_XYs[p], num_points, closed=True) for p in closed])
+    centres = curves.mean(axis=1)
+
+    radius = np.linalg.norm(curves - centres[:, None], axis=2)
+    radius = radius / np.maximum(radius.mean(axis=1, keepdims=True), 1e-12)
+    tangents = np.roll(curves, -1, axis=1) - curves
+    heading = np.arctan2(tangents[..., 1], tangents[..., 0])
+    turning = np.roll(heading, -1, axis=1) - heading
+    turning = (turning + np.pi) % (2 * np.pi) - np.pi
+
+    energy = []
+    for signature in (radius, turning):
+        spectrum = np.abs(np.fft.rfft(signature - signature.mean(axis=1, keepdims=True), axis=1)) ** 2
+        energy.append(spectrum[:, 1:])
+    harmonics = np.arange(1, energy[0].shape[1] + 1)
+    orders = np.arange(2, max_order + 1)
+    multiples = (harmonics[None, :] % orders[:, None]) == 0
+
+    fractions = []
+    for spectrum in energy:
+        total = spectrum.sum(axis=1, keepdims=True)
+        fractions.append((spectrum @ multiples.T) / np.maximum(total, 1e-12))
+    fraction = np.minimum(*fractions)
+    flat = (radius.std(axis=1) < flatness) & (turning.std(axis=1) < flatness * 2 * np.pi)
+
+    for i, p in enumerate(closed):
+        if flat[i]:
+            results[p] = (0, centres[i], 1.0)
+            continue
+        passing = np.flatnonzero(fraction[i] >= threshold)
+        if len(passing):
+            k = passing[-1]
+            results[p] = (int(orders[k]), centres[i], float(fraction[i, k]))
+        else:
+            results[p] = (1, centres[i], 0.0)
+    return results
+
+@instrumentation.timed('symmetry_detection.find_symmetry_and_reflect')
 def find_symmetry_and_reflect(path_XYs, symmetry_type):
+    if symmetry_type == "detected":
+        best_axes = [axes[0] for axes in detect_reflection_axes(path_XYs)]
+    elif symmetry_type == "rotational":
+        rotations = detect_rotational_symmetry(path_XYs)
     reflected_paths = []
-    for path in path_XYs:
+    for p, path in enumerate(path_XYs):
         reflected_path = []
         for segment in path:
             if symmetry_type == "vertical":
@@ -36,11 +220,19 @@ def find_symmetry_and_reflect(path_XYs, symmetry_type):
                               (segment[:, 1].min() + segment[:, 1].max()) / 2]
                 line_direction = [1, 1]  # 45-degree line
                 reflected_segment = reflect_points_across_line(segment, line_point, line_direction)
+            elif symmetry_type == "detected":
+                line_point, line_direction, _ = best_axes[p]
+                reflected_segment = reflect_points_across_line(segment, line_point, line_direction)
+            elif symmetry_type == "rotational":
+                # Rotate by one step of the detected symmetry; the identity without one
+                order, centre, _ = rotations[p]
+                angle = 2 * np.pi / order if order > 1 else 0.0
+                reflected_segment = rotate_points(segment, centre, angle) if centre is not None else np.array(segment)
             reflected_path.append(reflected_segment)
         reflected_paths.append(reflected_path)
     return reflected_paths
 
-def plot_paths_with_symmetry(original_paths, reflected_paths, colours, symmetry_type, output_file):
+def plot_paths_with_symmetry(original_paths, reflected_paths, colours, symmetry_type, output_file, show=True):
     fig, ax = plt.subplots(figsize=(8, 8))
     color_idx = 0
     for original_path, reflected_path in zip(original_paths, reflected_paths):
@@ -56,43 +248,83 @@ def plot_paths_with_symmetry(original_paths, reflected_paths, colours, symmetry_
     plt.grid(True, which='both', color='lightgray', linestyle='--')
     plt.title(f"Original and {symmetry_type.capitalize()} Reflected Paths")
     plt.savefig(output_file)
-    plt.show()
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
+
+def save_paths_with_symmetry(original_paths, reflected_paths, colours, svg_path, precision=3, relative=True):
+    # Same colouring as plot_paths_with_symmetry: one group per colour, solid for
+    # the originals and dashed for their reflections, one path element per path.
+    # The canvas covers every point, reflections included, which may fall
+    # left of or above the origin
+    points = [XY for paths in (original_paths, reflected_paths) for path in paths for XY in path if len(XY)]
+    if points:
+        points = np.concatenate(points)
+        low = np.minimum(np.floor(points.min(axis=0)), 0).astype(int)
+        width, height = np.ceil(points.max(axis=0)).astype(int) + 1 - low
+    else:
+        low, (width, height) = (0, 0), (1, 1)
+    with SVGWriter(svg_path, width, height, precision, relative, view_box=(low[0], low[1], width, height)) as svg:
+        for shift, dash in ((0, None), (1, '4 2')):
+            for c, colour in enumerate(colours):
+                svg.begin_group(to_hex(colour), 2, dash)
+                paths = reflected_paths if shift else original_paths
+                for p, path in enumerate(paths):
+                    if (p + shift) % len(colours) == c:
+                        svg.write_polylines(path)
 
-def read_svg(svg_path):
-    paths, attributes, svg_attributes = svg2paths2(svg_path)
+@instrumentation.timed('symmetry_detection.read_svg')
+def read_svg(svg_path, tolerance=0.1):
     path_XYs = []
-    for path in paths:
-        path_points = []
-        for segment in path:
-            segment_points = np.array([[point.real, point.imag] for point in segment])
-            path_points.append(segment_points)
-        path_XYs.append(path_points)
+    for path in iter_svg_paths(svg_path):
+        # Points on each segment, flattened adaptively to within the tolerance
+        points, offsets = flatten_segments(path, tolerance)
+        path_XYs.append(np.split(points, offsets[1:-1]))
     return path_XYs
 
-# Example usage
-input_svg = 'data/problems/frag2.svg'
-output_png_vertical = 'output_vertical.png'
-output_png_horizontal = 'output_horizontal.png'
-output_png_diagonal = 'output_diagonal.png'
-colours = ['r', 'g', 'b']
-
-# Read paths from SVG
-simplified_paths = read_svg(input_svg)
-
-# Debug: Print the paths read from the SVG
-print("Original Paths:")
-for path in simplified_paths:
-    for segment in path:
-        print(segment)
-
-# Find and plot symmetry for vertical reflection
-reflected_paths_vertical = find_symmetry_and_reflect(simplified_paths, "vertical")
-plot_paths_with_symmetry(simplified_paths, reflected_paths_vertical, colours, "vertical", output_png_vertical)
-
-# Find and plot symmetry for horizontal reflection
-reflected_paths_horizontal = find_symmetry_and_reflect(simplified_paths, "horizontal")
-plot_paths_with_symmetry(simplified_paths, reflected_paths_horizontal, colours, "horizontal", output_png_horizontal)
-
-# Find and plot symmetry for diagonal reflection
-reflected_paths_diagonal = find_symmetry_and_reflect(simplified_paths, "diagonal")
-plot_paths_with_symmetry(simplified_paths, reflected_paths_diagonal, colours, "diagonal", output_png_diagonal)
\ No newline at end of file
+if __name__ == "__main__":
+    # Example usage
+    input_svg = 'data/problems/frag2.svg'
+    output_png_vertical = 'output_vertical.png'
+    output_png_horizontal = 'output_horizontal.png'
+    output_png_diagonal = 'output_diagonal.png'
+    output_png_detected = 'output_detected.png'
+    output_png_rotational = 'output_rotational.png'
+    colours = ['r', 'g', 'b']
+
+    # Read paths from SVG
+    simplified_paths = read_svg(input_svg)
+
+    # Debug: Print the paths read from the SVG
+    print("Original Paths:")
+    for path in simplified_paths:
+        for segment in path:
+            print(segment)
+
+    # Find and plot symmetry for vertical reflection
+    reflected_paths_vertical = find_symmetry_and_reflect(simplified_paths, "vertical")
+    plot_paths_with_symmetry(simplified_paths, reflected_paths_vertical, colours, "vertical", output_png_vertical)
+
+    # Find and plot symmetry for horizontal reflection
+    reflected_paths_horizontal = find_symmetry_and_reflect(simplified_paths, "horizontal")
+    plot_paths_with_symmetry(simplified_paths, reflected_paths_horizontal, colours, "horizontal", output_png_horizontal)
+
+    # Find and plot symmetry for diagonal reflection
+    reflected_paths_diagonal = find_symmetry_and_reflect(simplified_paths, "diagonal")
+    plot_paths_with_symmetry(simplified_paths, reflected_paths_diagonal, colours, "diagonal", output_png_diagonal)
+
+    # Detect the best reflection axis of every path and reflect across it
+    for path_index, axes in enumerate(detect_reflection_axes(simplified_paths)):
+        for line_point, line_direction, residual in axes:
+            print(f"Path {path_index}: axis through {line_point} along {line_direction}, residual {residual:.3f}")
+    reflected_paths_detected = find_symmetry_and_reflect(simplified_paths, "detected")
+    plot_paths_with_symmetry(simplified_paths, reflected_paths_detected, colours, "detected", output_png_detected)
+    save_paths_with_symmetry(simplified_paths, reflected_paths_detected, colours, 'output_detected.svg')
+
+    # Detect rotational symmetry of closed paths and rotate each by one step of it
+    for path_index, (order, centre, score) in enumerate(detect_rotational_symmetry(simplified_paths)):
+        if centre is not None:
+            print(f"Path {path_index}: rotational order {order} about {centre}, score {score:.3f}")
+    reflected_paths_rotational = find_symmetry_and_reflect(simplified_paths, "rotational")
+    plot_paths_with_symmetry(simplified_paths, reflected_paths_rotational, colours, "rotational", output_png_rotational)